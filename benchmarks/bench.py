@@ -0,0 +1,290 @@
+"""
+Offline benchmark of the bot: updates are put into the queue of an application
+built like the bot's one, Telegram and RabbitMQ are replaced with in-process
+fakes with injected latency.
+
+    python -m benchmarks.bench --requests 500
+
+Caches, prefetching etc. follow the same environment variables as the bot.
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import time
+from typing import Optional
+
+from telegram import Bot, Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from randomall_tg_bot.app import create_router
+from randomall_tg_bot.callback_data import ACTION_FIRST, ACTION_REPEAT, CallbackData
+from randomall_tg_bot.config import SEND_CHAT_BURST, SEND_CHAT_RATE, SEND_MAX_RETRIES
+from randomall_tg_bot.logger import event_writer
+from randomall_tg_bot.messages import (
+    BUTTONS_MODE_CUSTOM,
+    BUTTONS_MODE_DEFAULT,
+    BUTTONS_MODE_RENAME,
+    COMMAND_CUSTOM_INFO,
+    COMMAND_CUSTOM_RESULT_MULTI,
+    COMMAND_CUSTOM_RESULT_SINGLE,
+    COMMAND_GENERAL_RESULT,
+)
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.ratelimit import SendScheduler
+from randomall_tg_bot.router import GENERAL
+from tests.fake import (
+    FakeMQ,
+    FakeResponder,
+    FakeTelegramRequest,
+    custom_info,
+    fake_application,
+    fake_update,
+)
+
+CUSTOM_INFOS = {
+    1: custom_info(1, BUTTONS_MODE_DEFAULT),
+    2: custom_info(2, BUTTONS_MODE_RENAME, {"title": "Жми"}),
+    3: custom_info(
+        3,
+        BUTTONS_MODE_CUSTOM,
+        {"items": [{"title": "Первая", "row": 0}, {"title": "Вторая", "row": 0}]},
+    ),
+}
+
+
+class Scenario:
+    """Same update sent `requests` times, every time from another chat"""
+
+    name: str
+
+    def __init__(
+        self,
+        name: str,
+        data: Optional[str] = None,
+        text: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.data = data
+        self.text = text
+
+    def make_update(self, update_id: int, bot: Bot) -> Update:
+        return fake_update(bot, update_id, update_id, self.text, self.data)
+
+
+def get_scenarios(general_action: str) -> list[Scenario]:
+    scenarios = [
+        Scenario(
+            f"{COMMAND_GENERAL_RESULT}:{target}",
+            data=CallbackData(
+                COMMAND_GENERAL_RESULT, general_action, target=target
+            ).encode(),
+        )
+        for _, target in GENERAL
+    ]
+
+    for id, info in CUSTOM_INFOS.items():
+        mode = info["format"]["buttons"]["mode"]
+        scenarios.append(Scenario(f"/custom:{mode}", text=f"/custom {id}"))
+        scenarios.append(
+            Scenario(
+                f"{COMMAND_CUSTOM_INFO}:{mode}",
+                data=CallbackData(COMMAND_CUSTOM_INFO, id=id).encode(),
+            )
+        )
+        for action in (ACTION_FIRST, ACTION_REPEAT):
+            if mode == BUTTONS_MODE_CUSTOM:
+                command = COMMAND_CUSTOM_RESULT_MULTI
+                data = CallbackData(command, action, id=id, button_id=1).encode()
+            else:
+                command = COMMAND_CUSTOM_RESULT_SINGLE
+                data = CallbackData(command, action, id=id).encode()
+            scenarios.append(Scenario(f"{command}:{mode}:{action}", data))
+
+    return scenarios
+
+
+class Result:
+    """
+    `serial` is the latency of one update if its Telegram calls and MQ
+    requests were made one after another, to compare with p50
+    """
+
+    name: str
+    elapsed: float
+    latencies: list[float]
+    serial: float
+
+    def __init__(
+        self, name: str, elapsed: float, latencies: list[float], serial: float
+    ) -> None:
+        self.name = name
+        self.elapsed = elapsed
+        self.latencies = latencies
+        self.serial = serial
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.elapsed
+
+    def percentile(self, p: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0]
+        return statistics.quantiles(self.latencies, n=100)[p - 1]
+
+
+class Timer:
+    """Latency of every update from its put into the queue until it is handled"""
+
+    def __init__(self) -> None:
+        self.started: dict[int, float] = {}
+        self.latencies: list[float] = []
+        self.done = asyncio.Event()
+
+    def start(self, update: Update) -> None:
+        self.started[update.update_id] = time.perf_counter()
+        self.done.clear()
+
+    async def stop(self, update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        # Runs after the handlers of the update in the group before
+        start = self.started.pop(update.update_id)
+        self.latencies.append(time.perf_counter() - start)
+        if len(self.started) == 0:
+            self.done.set()
+
+
+async def run_scenario(
+    scenario: Scenario,
+    app: Application,
+    timer: Timer,
+    update_ids: itertools.count,
+    requests: int,
+    responder: FakeResponder,
+    telegram_request: FakeTelegramRequest,
+) -> Result:
+    updates = [scenario.make_update(next(update_ids), app.bot) for _ in range(requests)]
+    timer.latencies = []
+
+    mq_requests = len(responder.requests)
+    telegram_calls = telegram_request.calls.total()
+    start = time.perf_counter()
+    for update in updates:
+        timer.start(update)
+        await app.update_queue.put(update)
+    await timer.done.wait()
+    elapsed = time.perf_counter() - start
+
+    mq_requests = len(responder.requests) - mq_requests
+    telegram_calls = telegram_request.calls.total() - telegram_calls
+    serial = (
+        mq_requests * responder.latency + telegram_calls * telegram_request.latency
+    ) / requests
+    return Result(scenario.name, elapsed, timer.latencies, serial)
+
+
+def print_results(results: list[Result]) -> None:
+    width = max(len(result.name) for result in results)
+    print(
+        f"{'path':<{width}} {'count':>6} {'rps':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'serial ms':>9}"
+    )
+    for result in results:
+        print(
+            f"{result.name:<{width}} {len(result.latencies):>6} "
+            f"{result.throughput:>9.1f} "
+            f"{result.percentile(50) * 1000:>8.2f} "
+            f"{result.percentile(95) * 1000:>8.2f} "
+            f"{result.percentile(99) * 1000:>8.2f} "
+            f"{result.serial * 1000:>9.2f}"
+        )
+
+
+async def run(args: argparse.Namespace) -> list[Result]:
+    pending = PendingRequests()
+    responder = FakeResponder(
+        args.mq_latency,
+        CUSTOM_INFOS,
+        slow_share=args.mq_slow_share,
+        slow_latency=args.mq_slow_latency,
+    )
+    mq = FakeMQ(responder, pending)
+    router = create_router(mq, pending)
+
+    telegram_request = FakeTelegramRequest(args.telegram_latency)
+    send_scheduler = SendScheduler(
+        args.send_rate, SEND_CHAT_RATE, SEND_CHAT_BURST, SEND_MAX_RETRIES
+    )
+    app = fake_application(router, telegram_request, send_scheduler)
+    timer = Timer()
+    app.add_handler(TypeHandler(Update, timer.stop), group=1)
+    await app.initialize()
+    await app.start()
+
+    prefetch_task = asyncio.create_task(router.general_prefetcher.run())
+    # Let the prefetcher fill its buffers like a warm bot would have
+    await asyncio.sleep(args.mq_latency * 2 + 0.01)
+
+    update_ids = itertools.count(1)
+    results = []
+    for scenario in get_scenarios(args.general_action):
+        if args.filter is not None and args.filter not in scenario.name:
+            continue
+        results.append(
+            await run_scenario(
+                scenario,
+                app,
+                timer,
+                update_ids,
+                args.requests,
+                responder,
+                telegram_request,
+            )
+        )
+
+    prefetch_task.cancel()
+    await app.stop()
+    await app.shutdown()
+
+    print_results(results)
+    print()
+    print(f"mq requests: {len(responder.requests)}")
+    print(f"telegram calls: {dict(telegram_request.calls)}")
+    requester = router.requester
+    print(f"hedged: {requester.hedged}, hedge wins: {requester.hedge_wins}")
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200, help="per path")
+    parser.add_argument("--mq-latency", type=float, default=0.005, help="seconds")
+    parser.add_argument(
+        "--mq-slow-share", type=float, default=0.0, help="of replies, e.g. 0.02"
+    )
+    parser.add_argument(
+        "--mq-slow-latency", type=float, default=1.0, help="seconds of slow replies"
+    )
+    parser.add_argument("--telegram-latency", type=float, default=0.02)
+    parser.add_argument(
+        "--send-rate",
+        type=float,
+        default=1_000_000,
+        help="global Bot API calls per second, instead of SEND_GLOBAL_RATE",
+    )
+    parser.add_argument(
+        "--general-action", choices=[ACTION_FIRST, ACTION_REPEAT], default=ACTION_REPEAT
+    )
+    parser.add_argument("--filter", help="only paths containing this string")
+    args = parser.parse_args()
+
+    # Benchmark actions are not worth keeping
+    event_writer.path = os.devnull
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
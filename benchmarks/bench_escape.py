@@ -0,0 +1,101 @@
+"""
+Compare MarkdownV2 escaping implementations.
+
+    python -m benchmarks.bench_escape --sizes 100 1000 10000
+
+Random strings are first checked to be escaped identically by all of them.
+"""
+
+import argparse
+import random
+import re
+import timeit
+from typing import Callable
+
+from randomall_tg_bot.router import MARKDOWN_V2_SPECIAL, escape_text
+
+ALPHABET = "\\ \nabcxyzабвгдеёжзя0123456789😀"
+
+TRANSLATE_TABLE = str.maketrans({ch: f"\\{ch}" for ch in MARKDOWN_V2_SPECIAL})
+SPECIAL_RE = re.compile(f"[{re.escape(MARKDOWN_V2_SPECIAL)}]")
+
+
+def escape_text_replace(text: str) -> str:
+    """Previous implementation, one replace per character"""
+    for ch in MARKDOWN_V2_SPECIAL:
+        text = text.replace(ch, f"\\{ch}")
+    return text
+
+
+def escape_text_translate(text: str) -> str:
+    return text.translate(TRANSLATE_TABLE)
+
+
+def escape_text_re(text: str) -> str:
+    return SPECIAL_RE.sub(lambda m: "\\" + m.group(), text)
+
+
+IMPLEMENTATIONS: dict[str, Callable[[str], str]] = {
+    "replace": escape_text_replace,
+    "translate": escape_text_translate,
+    "re": escape_text_re,
+    "current": escape_text,
+}
+
+
+def random_text(rng: random.Random, size: int, special: float) -> str:
+    """`special` is the share of characters that need escaping"""
+    return "".join(
+        rng.choice(MARKDOWN_V2_SPECIAL)
+        if rng.random() < special
+        else rng.choice(ALPHABET)
+        for _ in range(size)
+    )
+
+
+def check_equivalence(rng: random.Random, samples: int) -> None:
+    for _ in range(samples):
+        text = random_text(rng, rng.randrange(0, 200), rng.random())
+        expected = escape_text_replace(text)
+        for name, fn in IMPLEMENTATIONS.items():
+            actual = fn(text)
+            assert actual == expected, f"{name} {text!r}: {actual!r} != {expected!r}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000]
+    )
+    parser.add_argument(
+        "--special", type=float, nargs="+", default=[0.0, 0.05], help="share, 0..1"
+    )
+    parser.add_argument("--samples", type=int, default=10000, help="for the check")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    check_equivalence(rng, args.samples)
+    print(f"{args.samples} random strings escaped identically")
+    print()
+
+    print(
+        f"{'size':>8} {'special':>8}",
+        *(f"{name + ' us':>13}" for name in IMPLEMENTATIONS),
+    )
+    for special in args.special:
+        for size in args.sizes:
+            text = random_text(rng, size, special)
+            number = max(1, 100000 // size)
+            timings = [
+                min(timeit.repeat(lambda: fn(text), number=number, repeat=3)) / number
+                for fn in IMPLEMENTATIONS.values()
+            ]
+            print(
+                f"{size:>8} {special:>8}",
+                *(f"{timing * 1e6:>13.2f}" for timing in timings),
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Compare MQ message encoding and decoding with the previous message classes,
+which had no `__slots__`.
+
+    python -m benchmarks.bench_messages --number 100000
+
+Encode is what `MQ._make_request` does before publishing, decode is what
+`MQ.recv` and the router do with a reply body.
+"""
+
+import argparse
+import gc
+import timeit
+import tracemalloc
+from typing import Callable, Optional
+
+import orjson
+
+from randomall_tg_bot.messages import (
+    BUTTONS_MODE_CUSTOM,
+    COMMAND_CUSTOM_INFO,
+    COMMAND_CUSTOM_RESULT_MULTI,
+    COMMAND_GENERAL_RESULT,
+    RESPONSE_STATUS_OK,
+    ButtonsCustom,
+    CustomInfoResponsePayload,
+    CustomWithButtonIdRequestPayload,
+    GenerateResponsePayload,
+    Request,
+    Response,
+)
+
+UUID = "3f1c2a9e-4b5d-4e6f-8a7b-9c0d1e2f3a4b"
+
+
+class OldRequest:
+    """Previous classes, with instance `__dict__`"""
+
+    def __init__(self, uuid: str, command: str, payload: dict):
+        self.uuid = uuid
+        self.command = command
+        self.payload = payload
+
+    def to_dict(self) -> dict:
+        return {"uuid": self.uuid, "command": self.command, "payload": self.payload}
+
+
+class OldCustomWithButtonIdRequestPayload:
+    def __init__(self, id: int, button_id: int):
+        self.id = id
+        self.button_id = button_id
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "button_id": self.button_id}
+
+
+class OldResponse:
+    def __init__(
+        self, uuid: str, command: str, status: str, payload: Optional[dict]
+    ) -> None:
+        self.uuid = uuid
+        self.command = command
+        self.status = status
+        self.payload = payload
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "OldResponse":
+        return cls(
+            data.get("uuid"),  # type: ignore
+            data.get("command"),  # type: ignore
+            data.get("status"),  # type: ignore
+            data.get("payload"),  # type: ignore
+        )
+
+
+class OldGenerateResponsePayload:
+    def __init__(self, data: dict):
+        self.result = data.get("msg")
+
+
+class OldButtonsCustomItem:
+    def __init__(self, data: dict) -> None:
+        self.title = data.get("title")
+        self.row = data.get("row")
+
+
+class OldButtonsCustom:
+    def __init__(self, data: dict) -> None:
+        self.items = [OldButtonsCustomItem(item) for item in data["items"]]
+
+
+class OldCustomInfoResponsePayload:
+    def __init__(self, data: dict) -> None:
+        self.id = data.get("id")
+        self.title = data.get("title")
+        self.description = data.get("description")
+        self.format = data.get("format")
+
+
+GENERAL_BODY = orjson.dumps(
+    {
+        "uuid": UUID,
+        "command": COMMAND_GENERAL_RESULT,
+        "status": RESPONSE_STATUS_OK,
+        "payload": {"msg": "Высокий эльф с серебряными волосами и шрамом на щеке."},
+    }
+)
+CUSTOM_INFO_BODY = orjson.dumps(
+    {
+        "uuid": UUID,
+        "command": COMMAND_CUSTOM_INFO,
+        "status": RESPONSE_STATUS_OK,
+        "payload": {
+            "id": 123654,
+            "title": "Генератор",
+            "description": "Описание генератора.",
+            "format": {
+                "buttons": {
+                    "mode": BUTTONS_MODE_CUSTOM,
+                    "items": [
+                        {"title": f"Кнопка {i}", "row": i // 2} for i in range(6)
+                    ],
+                }
+            },
+        },
+    }
+)
+
+
+def old_encode() -> object:
+    payload = OldCustomWithButtonIdRequestPayload(123654, 3)
+    request = OldRequest(UUID, COMMAND_CUSTOM_RESULT_MULTI, payload.to_dict())
+    return orjson.dumps(request.to_dict())
+
+
+def new_encode() -> object:
+    payload = CustomWithButtonIdRequestPayload(123654, 3)
+    request = Request(UUID, COMMAND_CUSTOM_RESULT_MULTI, payload.to_dict())
+    return orjson.dumps(request.to_dict())
+
+
+def old_decode_general() -> object:
+    response = OldResponse.from_dict(orjson.loads(GENERAL_BODY))
+    return response, OldGenerateResponsePayload(response.payload)  # type: ignore
+
+
+def new_decode_general() -> object:
+    response = Response.from_dict(orjson.loads(GENERAL_BODY))
+    return response, GenerateResponsePayload(response.payload)  # type: ignore
+
+
+def old_decode_custom_info() -> object:
+    response = OldResponse.from_dict(orjson.loads(CUSTOM_INFO_BODY))
+    payload = OldCustomInfoResponsePayload(response.payload)  # type: ignore
+    return response, payload, OldButtonsCustom(payload.format["buttons"])  # type: ignore
+
+
+def new_decode_custom_info() -> object:
+    response = Response.from_dict(orjson.loads(CUSTOM_INFO_BODY))
+    payload = CustomInfoResponsePayload(response.payload)  # type: ignore
+    return response, payload, ButtonsCustom(payload.format["buttons"])
+
+
+CASES: list[tuple[str, Callable[[], object], Callable[[], object]]] = [
+    ("encode custom_result_multi", old_encode, new_encode),
+    ("decode general_result", old_decode_general, new_decode_general),
+    ("decode custom_info", old_decode_custom_info, new_decode_custom_info),
+]
+
+
+def time_per_call(fn: Callable[[], object], number: int) -> float:
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def bytes_per_call(fn: Callable[[], object], number: int) -> float:
+    """Memory held by the results, e.g. replies kept in caches and buffers"""
+    gc.collect()
+    tracemalloc.start()
+    results = [fn() for _ in range(number)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return size / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--number", type=int, default=100000)
+    args = parser.parse_args()
+
+    width = max(len(name) for name, _, _ in CASES)
+    print(
+        f"{'path':<{width}} {'old ns':>8} {'new ns':>8} "
+        f"{'old bytes':>10} {'new bytes':>10}"
+    )
+    for name, old, new in CASES:
+        print(
+            f"{name:<{width}} "
+            f"{time_per_call(old, args.number) * 1e9:>8.0f} "
+            f"{time_per_call(new, args.number) * 1e9:>8.0f} "
+            f"{bytes_per_call(old, args.number // 10):>10.0f} "
+            f"{bytes_per_call(new, args.number // 10):>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Publish throughput of MQ against the local fake broker, per channel pool size.
+
+    python -m benchmarks.bench_publish --requests 5000 --channels 1 2 4 8
+
+The fake broker handles publishes of a channel one by one, `--channel-latency`
+each, so a single channel caps throughput like a RabbitMQ channel does.
+"""
+
+import argparse
+import asyncio
+import time
+from contextlib import suppress
+
+from randomall_tg_bot.mq import MQ
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import (
+    CHANNEL_SELECTION_LEAST_BUSY,
+    CHANNEL_SELECTION_ROUND_ROBIN,
+)
+from tests.fake import FakeBroker, FakeResponder
+
+
+async def measure(
+    broker: FakeBroker, channels: int, selection: str, requests: int
+) -> float:
+    """Requests published and confirmed per second"""
+    pending = PendingRequests()
+    mq = MQ(
+        broker.url,
+        pending,
+        publish_queue_size=requests,
+        publish_channels=channels,
+        publish_channel_selection=selection,
+    )
+    await mq.connect()
+    publisher_task = asyncio.create_task(mq.publisher.run())
+    try:
+        start = time.perf_counter()
+        for _ in range(requests):
+            uuid, _ = pending.create(60)
+            await mq.general_result(uuid, "fantasy_name")
+        while mq.publisher.published + mq.publisher.failed < requests:
+            await asyncio.sleep(0.001)
+        elapsed = time.perf_counter() - start
+    finally:
+        publisher_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await publisher_task
+        await mq.close()
+
+    assert mq.publisher.failed == 0
+    return requests / elapsed
+
+
+async def run(args: argparse.Namespace) -> None:
+    broker = FakeBroker(FakeResponder(), channel_latency=args.channel_latency)
+    await broker.start()
+
+    print(f"{'channels':>8} {'selection':>12} {'rps':>9}")
+    try:
+        for channels in args.channels:
+            for selection in args.selection:
+                rps = await measure(broker, channels, selection, args.requests)
+                print(f"{channels:>8} {selection:>12} {rps:>9.0f}")
+    finally:
+        await broker.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--channels", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--selection",
+        nargs="+",
+        choices=[CHANNEL_SELECTION_LEAST_BUSY, CHANNEL_SELECTION_ROUND_ROBIN],
+        default=[CHANNEL_SELECTION_LEAST_BUSY, CHANNEL_SELECTION_ROUND_ROBIN],
+    )
+    parser.add_argument(
+        "--channel-latency",
+        type=float,
+        default=0.001,
+        help="seconds the broker spends on a publish",
+    )
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+
+class BusyError(Exception):
+    """Too many requests in flight, the caller should answer with busy message"""
+
+
+class AdmissionControl:
+    """
+    Limits MQ requests in flight, in total and per user.
+    With `target_latency` the total limit adapts: it is cut by a quarter when
+    the smoothed round trip gets slower than the target, at most once per
+    target latency, and grows back by one for every request answered in time.
+    0 disables a limit.
+    """
+
+    max_in_flight: int
+    max_per_user: int
+    min_in_flight: int
+    target_latency: float
+
+    limit: float
+    latency: float
+    in_flight: int
+    rejected: int
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_per_user: int,
+        target_latency: float = 0.0,
+        min_in_flight: int = 1,
+        smoothing: float = 0.2,
+        timer: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_per_user = max_per_user
+        self.target_latency = target_latency
+        self.min_in_flight = min_in_flight
+        self.smoothing = smoothing
+        self._timer = timer
+
+        self.limit = float(max_in_flight)
+        self.latency = 0.0
+        self.in_flight = 0
+        self.rejected = 0
+        self._per_user: dict[int, int] = {}
+        self._decreased_at = 0.0
+
+    def acquire(self, user_id: int) -> None:
+        """Take a slot, raises BusyError"""
+        if self.max_in_flight > 0 and self.in_flight >= int(self.limit):
+            self.rejected += 1
+            raise BusyError("Too many requests in flight")
+
+        user_in_flight = self._per_user.get(user_id, 0)
+        if self.max_per_user > 0 and user_in_flight >= self.max_per_user:
+            self.rejected += 1
+            raise BusyError("Too many requests of the user in flight")
+
+        self.in_flight += 1
+        self._per_user[user_id] = user_in_flight + 1
+
+    def release(self, user_id: int, latency: Optional[float] = None) -> None:
+        """Free the slot, `latency` of the answered or expired request"""
+        self.in_flight -= 1
+        user_in_flight = self._per_user.get(user_id, 0) - 1
+        if user_in_flight > 0:
+            self._per_user[user_id] = user_in_flight
+        else:
+            self._per_user.pop(user_id, None)
+
+        if latency is not None:
+            self._observe(latency)
+
+    @contextmanager
+    def admit(self, user_id: int) -> Iterator[None]:
+        """Hold a slot for the block, raises BusyError"""
+        self.acquire(user_id)
+        start = self._timer()
+        latency: Optional[float] = None
+        try:
+            yield
+            latency = self._timer() - start
+        except asyncio.exceptions.TimeoutError:
+            latency = self._timer() - start
+            raise
+        finally:
+            self.release(user_id, latency)
+
+    def _observe(self, latency: float) -> None:
+        if self.target_latency <= 0 or self.max_in_flight <= 0:
+            return
+
+        self.latency += (latency - self.latency) * self.smoothing
+        if self.latency <= self.target_latency:
+            self.limit = min(self.limit + 1, self.max_in_flight)
+            return
+
+        now = self._timer()
+        if now - self._decreased_at >= self.target_latency:
+            self.limit = max(self.limit * 0.75, self.min_in_flight)
+            self._decreased_at = now
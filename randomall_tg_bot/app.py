@@ -0,0 +1,405 @@
+import asyncio
+import logging
+from asyncio import AbstractEventLoop
+from typing import Any, Optional
+
+from telegram.ext import (
+    Application,
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
+)
+
+from randomall_tg_bot.admission import AdmissionControl
+from randomall_tg_bot.cache import TTLCache
+from randomall_tg_bot.config import (
+    ADMISSION_MAX_IN_FLIGHT,
+    ADMISSION_MAX_PER_USER,
+    ADMISSION_MIN_IN_FLIGHT,
+    ADMISSION_TARGET_LATENCY,
+    CALLBACK_DEBOUNCE,
+    CONCURRENT_UPDATES,
+    CUSTOM_INFO_CACHE_NEGATIVE_TTL,
+    CUSTOM_INFO_CACHE_SIZE,
+    CUSTOM_INFO_CACHE_TTL,
+    MARKUP_CACHE_SIZE,
+    METRICS_HOST,
+    METRICS_PORT,
+    MQ_ACK_BATCH_SIZE,
+    MQ_ACK_INTERVAL,
+    MQ_ACK_MODE,
+    MQ_PREFETCH_COUNT,
+    MQ_PUBLISH_BATCH_SIZE,
+    MQ_PUBLISH_CHANNEL_SELECTION,
+    MQ_PUBLISH_CHANNELS,
+    MQ_PUBLISH_QUEUE_POLICY,
+    MQ_PUBLISH_QUEUE_SIZE,
+    MQ_PUBLISHER_CONFIRMS,
+    MQ_RECONNECT_MAX_DELAY,
+    MQ_RECONNECT_MIN_DELAY,
+    MQ_RPC,
+    MQ_URL,
+    PREFETCH_INTERVAL,
+    PREFETCH_SIZE,
+    PREFETCH_TARGETS,
+    PREFETCH_WATERMARK,
+    REQUEST_HEDGE_BUDGET,
+    REQUEST_HEDGE_QUANTILE,
+    REQUEST_TIMEOUT_MIN,
+    REQUEST_TIMEOUT_MULTIPLIER,
+    SEND_CHAT_BURST,
+    SEND_CHAT_RATE,
+    SEND_GLOBAL_RATE,
+    SEND_MAX_RETRIES,
+    SHUTDOWN_GRACE_PERIOD,
+    TELEGRAM_API_TOKEN,
+    TELEGRAM_API_URL,
+    TELEGRAM_WEBHOOK_SECRET,
+    TELEGRAM_WEBHOOK_URL,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WORKERS,
+)
+from randomall_tg_bot.logger import close_event_log, event_writer
+from randomall_tg_bot.messages import Response
+from randomall_tg_bot.metrics import registry, serve_metrics, timed
+from randomall_tg_bot.mq import MQ
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.prefetch import GeneralPrefetcher
+from randomall_tg_bot.ratelimit import SendScheduler
+from randomall_tg_bot.requester import Requester
+from randomall_tg_bot.router import GENERAL, TIMEOUT, MarkupCache, Router
+from randomall_tg_bot.supervisor import MQSupervisor
+from randomall_tg_bot.updates import ChatUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def create_router(mq: MQ, pending: PendingRequests) -> Router:
+    custom_info_cache: TTLCache[int, Response] = TTLCache(
+        CUSTOM_INFO_CACHE_SIZE, CUSTOM_INFO_CACHE_TTL
+    )
+    general_prefetcher = GeneralPrefetcher(
+        mq,
+        pending,
+        PREFETCH_TARGETS
+        if PREFETCH_TARGETS is not None
+        else [target for _, target in GENERAL],
+        PREFETCH_SIZE,
+        PREFETCH_WATERMARK,
+        PREFETCH_INTERVAL,
+        TIMEOUT,
+    )
+    requester = Requester(
+        pending,
+        TIMEOUT,
+        REQUEST_TIMEOUT_MIN,
+        REQUEST_TIMEOUT_MULTIPLIER,
+        REQUEST_HEDGE_QUANTILE,
+        REQUEST_HEDGE_BUDGET,
+    )
+    return Router(
+        mq,
+        requester,
+        custom_info_cache,
+        CUSTOM_INFO_CACHE_NEGATIVE_TTL,
+        general_prefetcher,
+        MarkupCache(MARKUP_CACHE_SIZE),
+        AdmissionControl(
+            ADMISSION_MAX_IN_FLIGHT,
+            ADMISSION_MAX_PER_USER,
+            ADMISSION_TARGET_LATENCY,
+            ADMISSION_MIN_IN_FLIGHT,
+        ),
+        CALLBACK_DEBOUNCE,
+    )
+
+
+def application_builder(send_scheduler: SendScheduler) -> ApplicationBuilder:
+    """Bot API and update handling settings of the application"""
+    return (
+        Application.builder()
+        .token(TELEGRAM_API_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .rate_limiter(send_scheduler)
+        .concurrent_updates(ChatUpdateProcessor(CONCURRENT_UPDATES))
+    )
+
+
+def add_handlers(app: Application, router: Router) -> None:
+    app.add_handler(CommandHandler(["start", "help"], timed("help")(router.help)))
+    app.add_handler(CommandHandler(["general", "g"], timed("general")(router.general)))
+    app.add_handler(CommandHandler(["custom", "c"], timed("custom")(router.custom)))
+    app.add_handler(CallbackQueryHandler(timed("callback")(router.callback)))
+
+
+def register_metrics(
+    router: Router,
+    pending: PendingRequests,
+    supervisor: MQSupervisor,
+    send_scheduler: SendScheduler,
+) -> None:
+    registry.callback(
+        "bot_mq_connected",
+        "1 while connected to RabbitMQ",
+        lambda: int(supervisor.mq.connected),
+    )
+    registry.callback(
+        "bot_mq_reconnects_total",
+        "Attempts to connect to RabbitMQ again",
+        lambda: supervisor.reconnects,
+        "counter",
+    )
+    registry.callback(
+        "bot_mq_in_flight", "Requests waiting for a reply", lambda: len(pending)
+    )
+    registry.callback(
+        "bot_mq_oldest_in_flight_seconds",
+        "Age of the oldest request waiting for a reply",
+        pending.oldest_age,
+    )
+    publisher = router.mq.publisher
+    registry.callback(
+        "bot_mq_publish_queue_size",
+        "Requests waiting to be published",
+        lambda: len(publisher),
+    )
+    registry.callback(
+        "bot_mq_publish_shed_total",
+        "Requests dropped from the full publish queue",
+        lambda: publisher.shed,
+        "counter",
+    )
+    registry.callback(
+        "bot_mq_publish_rejected_total",
+        "Requests rejected because the publish queue was full",
+        lambda: publisher.rejected,
+        "counter",
+    )
+    registry.callback(
+        "bot_mq_publish_failed_total",
+        "Requests RabbitMQ did not accept",
+        lambda: publisher.failed,
+        "counter",
+    )
+    pool = publisher.pool
+    registry.callback(
+        "bot_mq_publish_channels",
+        "Open channels requests are published on",
+        lambda: pool.open_channels,
+    )
+    registry.callback(
+        "bot_mq_publish_channels_replaced_total",
+        "Closed publish channels opened again",
+        lambda: pool.replaced,
+        "counter",
+    )
+    registry.callback(
+        "bot_mq_timeouts_total",
+        "Requests without a reply in time",
+        lambda: pending.expired,
+        "counter",
+    )
+
+    requester = router.requester
+    registry.callback(
+        "bot_mq_hedged_total",
+        "Requests sent once more after no reply by the hedge quantile",
+        lambda: requester.hedged,
+        "counter",
+    )
+    registry.callback(
+        "bot_mq_hedge_wins_total",
+        "Hedged requests answered first by the second copy",
+        lambda: requester.hedge_wins,
+        "counter",
+    )
+
+    cache = router.custom_info_cache
+    registry.callback(
+        "bot_custom_info_cache_hits_total",
+        "custom_info served from cache",
+        lambda: cache.hits,
+        "counter",
+    )
+    registry.callback(
+        "bot_custom_info_cache_misses_total",
+        "custom_info not found in cache",
+        lambda: cache.misses,
+        "counter",
+    )
+    registry.callback(
+        "bot_custom_info_cache_evictions_total",
+        "custom_info dropped from full cache",
+        lambda: cache.evictions,
+        "counter",
+    )
+    registry.callback(
+        "bot_custom_info_cache_size", "custom_info entries in cache", lambda: len(cache)
+    )
+    registry.callback(
+        "bot_custom_info_coalesced_total",
+        "custom_info requests served by a request already in flight",
+        lambda: router.custom_info_coalesced,
+        "counter",
+    )
+
+    registry.callback(
+        "bot_callback_deduped_total",
+        "Button presses only answered, the message was pressed just before",
+        lambda: router.callback_deduped,
+        "counter",
+    )
+
+    registry.callback(
+        "bot_markup_cache_size",
+        "Custom generators with built keyboards",
+        lambda: len(router.markups),
+    )
+
+    admission = router.admission
+    registry.callback(
+        "bot_admission_limit",
+        "Current limit of requests in flight",
+        lambda: admission.limit,
+    )
+    registry.callback(
+        "bot_admission_rejected_total",
+        "Requests answered with busy message",
+        lambda: admission.rejected,
+        "counter",
+    )
+
+    prefetcher = router.general_prefetcher
+    registry.callback(
+        "bot_prefetched_results",
+        "General results ready in prefetch buffers",
+        lambda: sum(len(buffer) for buffer in prefetcher.buffers.values()),
+    )
+
+    registry.callback(
+        "bot_telegram_sent_total",
+        "Bot API requests sent",
+        lambda: send_scheduler.sent,
+        "counter",
+    )
+    registry.callback(
+        "bot_telegram_retries_total",
+        "Bot API requests retried after flood limit",
+        lambda: send_scheduler.retries,
+        "counter",
+    )
+    registry.callback(
+        "bot_telegram_waiting",
+        "Bot API requests waiting for send budget",
+        lambda: send_scheduler.waiting,
+    )
+
+    registry.callback(
+        "bot_actions_dropped_total",
+        "Action log events dropped because the queue was full",
+        lambda: event_writer.dropped,
+        "counter",
+    )
+
+
+async def stop_task(task: asyncio.Task, name: str) -> None:
+    """Cancel and wait for `task`, its failure is logged, not raised"""
+    task.cancel()
+    results = await asyncio.gather(task, return_exceptions=True)
+    if isinstance(results[0], Exception):
+        logger.error("%s failed", name, exc_info=results[0])
+
+
+def create_application(
+    loop: AbstractEventLoop,
+    updater: bool = True,
+    metrics_port: int = METRICS_PORT,
+) -> Application:
+    """
+    Build application with router handlers, MQ is connected in the background.
+    Application without `updater` only processes updates put into its queue.
+    """
+    pending = PendingRequests()
+    mq = MQ(
+        MQ_URL,
+        pending,
+        MQ_RPC,
+        MQ_PUBLISHER_CONFIRMS,
+        MQ_PUBLISH_QUEUE_SIZE,
+        MQ_PUBLISH_QUEUE_POLICY,
+        MQ_PUBLISH_BATCH_SIZE,
+        MQ_PUBLISH_CHANNELS,
+        MQ_PUBLISH_CHANNEL_SELECTION,
+        MQ_PREFETCH_COUNT,
+        MQ_ACK_MODE,
+        MQ_ACK_BATCH_SIZE,
+        MQ_ACK_INTERVAL,
+    )
+    router = create_router(mq, pending)
+
+    supervisor = MQSupervisor(mq, MQ_RECONNECT_MIN_DELAY, MQ_RECONNECT_MAX_DELAY)
+    supervisor_task = loop.create_task(supervisor.run())
+    prefetch_task = loop.create_task(router.general_prefetcher.run())
+
+    async def on_shutdown(_: Application) -> None:
+        # Received updates are handled by now, prefetched results are not needed
+        await stop_task(prefetch_task, "Prefetcher")
+
+        await supervisor.drain(SHUTDOWN_GRACE_PERIOD)
+        close_event_log()
+
+        # Fails whatever is left and closes the connection
+        await stop_task(supervisor_task, "MQ supervisor")
+
+    send_scheduler = SendScheduler(
+        SEND_GLOBAL_RATE / WORKERS,
+        SEND_CHAT_RATE,
+        SEND_CHAT_BURST,
+        SEND_MAX_RETRIES,
+    )
+
+    builder = application_builder(send_scheduler).post_shutdown(on_shutdown)
+    if not updater:
+        builder = builder.updater(None)
+    app = builder.build()
+    add_handlers(app, router)
+
+    if metrics_port:
+        register_metrics(router, pending, supervisor, send_scheduler)
+        loop.run_until_complete(serve_metrics(METRICS_HOST, metrics_port))
+
+    return app
+
+
+def webhook_options() -> Optional[dict[str, Any]]:
+    """
+    Arguments of `run_webhook`, None if updates are received with long polling.
+    Raises ValueError if the webhook url is set without a secret, anyone who
+    knows the url could send updates otherwise.
+    """
+    if not TELEGRAM_WEBHOOK_URL:
+        return None
+    if not TELEGRAM_WEBHOOK_SECRET:
+        raise ValueError(
+            "TELEGRAM_WEBHOOK_SECRET is required with TELEGRAM_WEBHOOK_URL"
+        )
+
+    return {
+        "listen": WEBHOOK_LISTEN,
+        "port": WEBHOOK_PORT,
+        "url_path": WEBHOOK_PATH,
+        "webhook_url": TELEGRAM_WEBHOOK_URL,
+        "secret_token": TELEGRAM_WEBHOOK_SECRET,
+    }
+
+
+def run_application(app: Application) -> None:
+    """Receive updates until stopped"""
+    webhook = webhook_options()
+    if webhook is not None:
+        # Stops on SIGINT/SIGTERM and runs post_shutdown like polling does
+        app.run_webhook(**webhook)
+    else:
+        app.run_polling()
@@ -0,0 +1,165 @@
+"""
+Inline button callback data.
+
+Current format is `<version><opcode><args>`: opcode is one character for
+command and action, integer args are base36 and separated with ".", e.g.
+`1e2neu` is the repeat button of custom generator 123654.
+Data of buttons sent before the format existed
+(`custom_result_multi:multi:repeat:<id>:<button_id>`, ...) is still decoded.
+"""
+
+from typing import Optional
+
+from randomall_tg_bot.messages import (
+    COMMAND_CUSTOM_INFO,
+    COMMAND_CUSTOM_RESULT_MULTI,
+    COMMAND_CUSTOM_RESULT_SINGLE,
+    COMMAND_GENERAL_RESULT,
+)
+
+ACTION_FIRST = "first"
+ACTION_REPEAT = "repeat"
+
+VERSION = "1"
+# Telegram limit for callback_data in bytes
+MAX_LENGTH = 64
+
+SEPARATOR = "."
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# opcode -> command, action
+OPCODES: dict[str, tuple[str, Optional[str]]] = {
+    "a": (COMMAND_GENERAL_RESULT, ACTION_FIRST),
+    "b": (COMMAND_GENERAL_RESULT, ACTION_REPEAT),
+    "c": (COMMAND_CUSTOM_INFO, None),
+    "d": (COMMAND_CUSTOM_RESULT_SINGLE, ACTION_FIRST),
+    "e": (COMMAND_CUSTOM_RESULT_SINGLE, ACTION_REPEAT),
+    "f": (COMMAND_CUSTOM_RESULT_MULTI, ACTION_FIRST),
+    "g": (COMMAND_CUSTOM_RESULT_MULTI, ACTION_REPEAT),
+}
+OPCODES_BY_COMMAND = {value: opcode for opcode, value in OPCODES.items()}
+ARITY = {
+    COMMAND_GENERAL_RESULT: 1,
+    COMMAND_CUSTOM_INFO: 1,
+    COMMAND_CUSTOM_RESULT_SINGLE: 1,
+    COMMAND_CUSTOM_RESULT_MULTI: 2,
+}
+
+
+def encode_int(n: int) -> str:
+    if n < 0:
+        return "-" + encode_int(-n)
+
+    digits = []
+    while True:
+        n, rem = divmod(n, 36)
+        digits.append(DIGITS[rem])
+        if n == 0:
+            break
+    return "".join(reversed(digits))
+
+
+class InvalidIdError(ValueError):
+    """Callback data is well formed, but a generator or button id is not a number"""
+
+
+def decode_int(s: str, base: int = 36) -> int:
+    try:
+        return int(s, base)
+    except ValueError:
+        raise InvalidIdError(f"Id {s!r} is not a number")
+
+
+class CallbackData:
+    command: str
+    action: Optional[str]
+    target: Optional[str]
+    id: Optional[int]
+    button_id: Optional[int]
+
+    def __init__(
+        self,
+        command: str,
+        action: Optional[str] = None,
+        target: Optional[str] = None,
+        id: Optional[int] = None,
+        button_id: Optional[int] = None,
+    ) -> None:
+        self.command = command
+        self.action = action
+        self.target = target
+        self.id = id
+        self.button_id = button_id
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, CallbackData) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        return f"CallbackData({vars(self)})"
+
+    def encode(self) -> str:
+        opcode = OPCODES_BY_COMMAND[(self.command, self.action)]
+        if self.command == COMMAND_GENERAL_RESULT:
+            assert self.target is not None
+            args = [self.target]
+        elif self.command == COMMAND_CUSTOM_RESULT_MULTI:
+            assert self.id is not None and self.button_id is not None
+            args = [encode_int(self.id), encode_int(self.button_id)]
+        else:
+            assert self.id is not None
+            args = [encode_int(self.id)]
+
+        data = VERSION + opcode + SEPARATOR.join(args)
+        if len(data.encode()) > MAX_LENGTH:
+            raise ValueError(f"Callback data is longer than {MAX_LENGTH} bytes")
+        return data
+
+    @classmethod
+    def decode(cls, data: str) -> "CallbackData":
+        """Raise ValueError if data is malformed, InvalidIdError if an id is"""
+        if data[:1] == VERSION:
+            try:
+                command, action = OPCODES[data[1:2]]
+            except KeyError:
+                raise ValueError(f"Unknown opcode in {data!r}")
+            args = data[2:].split(SEPARATOR)
+            if len(args) != ARITY[command]:
+                raise ValueError(f"Wrong number of arguments in {data!r}")
+            if command == COMMAND_GENERAL_RESULT:
+                if args[0] == "":
+                    raise ValueError(f"Empty target in {data!r}")
+                return cls(command, action, target=args[0])
+            if command == COMMAND_CUSTOM_RESULT_MULTI:
+                return cls(
+                    command,
+                    action,
+                    id=decode_int(args[0]),
+                    button_id=decode_int(args[1]),
+                )
+            return cls(command, action, id=decode_int(args[0]))
+
+        return cls._decode_legacy(data)
+
+    @classmethod
+    def _decode_legacy(cls, data: str) -> "CallbackData":
+        command, _, rest = data.partition(":")
+        if command == COMMAND_GENERAL_RESULT:
+            action, _, name = rest.partition(":")
+            if name == "":
+                raise ValueError(f"Empty target in {data!r}")
+            return cls(command, action, target=name)
+        if command == COMMAND_CUSTOM_INFO:
+            return cls(command, id=decode_int(rest, 10))
+        if command == COMMAND_CUSTOM_RESULT_SINGLE:
+            _, action, id = rest.split(":", 2)
+            return cls(command, action, id=decode_int(id, 10))
+        if command == COMMAND_CUSTOM_RESULT_MULTI:
+            _, action, id, button_id = rest.split(":", 3)
+            return cls(
+                command,
+                action,
+                id=decode_int(id, 10),
+                button_id=decode_int(button_id, 10),
+            )
+
+        raise ValueError(f"Unknown callback data {data!r}")
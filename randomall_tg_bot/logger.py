@@ -1,38 +1,30 @@
-import json
 import logging
+import os
+import queue
+import threading
+import time
 from datetime import datetime, timezone
-
-from randomall_tg_bot.config import DEBUG, LOG_PATH
-
-
-class LevelFilter:
-    def __init__(self, level):
-        self._level = level
-
-    def filter(self, log_record):
-        return log_record.levelno == self._level
-
-
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-
-if DEBUG:
-    # handler = logging.StreamHandler()
-    handler = logging.FileHandler(f"{LOG_PATH}/actions.log")
-else:
-    handler = logging.FileHandler(f"{LOG_PATH}/actions.log")
-
-formatter = logging.Formatter("%(asctime)s %(message)s")
-formatter.formatTime = (  # type: ignore
-    lambda record, datefmt=None: datetime.fromtimestamp(record.created, timezone.utc)
-    .astimezone()
-    .isoformat(sep="T", timespec="milliseconds")
+from typing import IO, Optional
+
+import orjson
+
+from randomall_tg_bot.config import (
+    LOG_BACKUP_COUNT,
+    LOG_BATCH_SIZE,
+    LOG_FLUSH_INTERVAL,
+    LOG_MAX_BYTES,
+    LOG_PATH,
+    LOG_QUEUE_POLICY,
+    LOG_QUEUE_SIZE,
 )
 
-handler.setFormatter(formatter)
+LOG_QUEUE_POLICY_DROP = "drop"
+LOG_QUEUE_POLICY_BLOCK = "block"
+# Longest a full queue blocks the caller with block policy, the event loop
+# thread stalls meanwhile, so the event is dropped after it
+LOG_QUEUE_BLOCK_TIMEOUT = 0.1
 
-logger.addFilter(LevelFilter(level=logging.INFO))  # type: ignore
-logger.addHandler(handler)
+logger = logging.getLogger(__name__)
 
 
 class Action:
@@ -48,17 +40,18 @@ class Event:
         self.action = action
         self.user_id = user_id
         self.payload = payload
+        self.created = time.time()
 
-    def to_json(self) -> str:
+    def to_json(self) -> bytes:
         if self.payload is None:
-            return json.dumps(
+            return orjson.dumps(
                 {
                     "action": self.action,
                     "user_id": self.user_id,
                 }
             )
         else:
-            return json.dumps(
+            return orjson.dumps(
                 {
                     "action": self.action,
                     "user_id": self.user_id,
@@ -66,6 +59,168 @@ class Event:
                 }
             )
 
+    def to_line(self) -> bytes:
+        created = (
+            datetime.fromtimestamp(self.created, timezone.utc)
+            .astimezone()
+            .isoformat(sep="T", timespec="milliseconds")
+        )
+        return created.encode() + b" " + self.to_json() + b"\n"
+
+
+class EventWriter:
+    """
+    Writes events to file from a background thread.
+    The caller only puts events into a bounded queue, when it is full
+    events are dropped or the caller blocks for a bounded time, depending on
+    `policy`.
+    """
+
+    path: str
+    policy: str
+    flush_interval: float
+    batch_size: int
+    max_bytes: int
+    backup_count: int
+
+    dropped: int
+    written: int
+
+    def __init__(
+        self,
+        path: str,
+        queue_size: int,
+        policy: str,
+        flush_interval: float,
+        batch_size: int,
+        max_bytes: int,
+        backup_count: int,
+    ) -> None:
+        self.path = path
+        self.policy = policy
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self.dropped = 0
+        self.written = 0
+
+        self._queue: queue.Queue[Optional[Event]] = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._file: Optional[IO[bytes]] = None
+
+    def put(self, event: Event) -> None:
+        self._ensure_started()
+        try:
+            if self.policy == LOG_QUEUE_POLICY_BLOCK:
+                self._queue.put(event, timeout=LOG_QUEUE_BLOCK_TIMEOUT)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Write queued events and stop the thread"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+
+        self._queue.put(None)
+        thread.join()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="event-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            batch: list[bytes] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    event = (
+                        self._queue.get(timeout=timeout)
+                        if timeout > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+                if event is None:
+                    stop = True
+                    break
+                batch.append(event.to_line())
+
+            if len(batch) > 0:
+                try:
+                    self._write(b"".join(batch))
+                    self.written += len(batch)
+                except OSError:
+                    logger.exception("Failed to write %s events", len(batch))
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, data: bytes) -> None:
+        if self._file is None:
+            self._file = open(self.path, "ab")
+
+        self._file.write(data)
+        self._file.flush()
+
+        if self.max_bytes > 0 and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        """Same naming as logging.handlers.RotatingFileHandler"""
+        assert self._file is not None
+        self._file.close()
+        self._file = None
+
+        if self.backup_count <= 0:
+            os.truncate(self.path, 0)
+            return
+
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+def event_log_path(worker: Optional[int] = None) -> str:
+    """Every worker writes and rotates its own file"""
+    if worker is None:
+        return f"{LOG_PATH}/actions.log"
+    return f"{LOG_PATH}/actions-{worker}.log"
+
+
+event_writer = EventWriter(
+    event_log_path(),
+    LOG_QUEUE_SIZE,
+    LOG_QUEUE_POLICY,
+    LOG_FLUSH_INTERVAL,
+    LOG_BATCH_SIZE,
+    LOG_MAX_BYTES,
+    LOG_BACKUP_COUNT,
+)
+
 
 def log_event(event: Event):
-    logger.info(event.to_json())
+    event_writer.put(event)
+
+
+def close_event_log() -> None:
+    event_writer.close()
@@ -7,6 +7,7 @@ RESPONSE_STATUS_INTERNAL_ERROR = "InternalError"
 RESPONSE_STATUS_NOT_IMPLEMENTED = "NotImplemented"
 
 COMMAND_GENERAL_RESULT = "general_result"
+COMMAND_GENERAL_RESULT_BATCH = "general_result_batch"
 COMMAND_CUSTOM_INFO = "custom_info"
 COMMAND_CUSTOM_RESULT_SINGLE = "custom_result_single"
 COMMAND_CUSTOM_RESULT_MULTI = "custom_result_multi"
@@ -17,6 +18,8 @@ BUTTONS_MODE_CUSTOM = "custom"
 
 
 class Request:
+    __slots__ = ("uuid", "command", "payload")
+
     uuid: str
     command: str
     payload: dict
@@ -35,6 +38,8 @@ class Request:
 
 
 class GeneralRequestPayload:
+    __slots__ = ("name",)
+
     name: str
 
     def __init__(self, name: str):
@@ -44,7 +49,23 @@ class GeneralRequestPayload:
         return {"name": self.name}
 
 
+class GeneralBatchRequestPayload:
+    __slots__ = ("name", "count")
+
+    name: str
+    count: int
+
+    def __init__(self, name: str, count: int):
+        self.name = name
+        self.count = count
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "count": self.count}
+
+
 class CustomRequestPayload:
+    __slots__ = ("id",)
+
     id: int
 
     def __init__(self, id: int):
@@ -55,6 +76,8 @@ class CustomRequestPayload:
 
 
 class CustomWithButtonIdRequestPayload:
+    __slots__ = ("id", "button_id")
+
     id: int
     button_id: int
 
@@ -67,6 +90,8 @@ class CustomWithButtonIdRequestPayload:
 
 
 class ButtonsRename:
+    __slots__ = ("title",)
+
     title: str
 
     def __init__(self, data: dict) -> None:
@@ -74,6 +99,8 @@ class ButtonsRename:
 
 
 class ButtonsCustomItem:
+    __slots__ = ("title", "row")
+
     title: str
     row: int
 
@@ -83,6 +110,8 @@ class ButtonsCustomItem:
 
 
 class ButtonsCustom:
+    __slots__ = ("items",)
+
     items: List[ButtonsCustomItem]
 
     def __init__(self, data: dict) -> None:
@@ -92,13 +121,26 @@ class ButtonsCustom:
 
 
 class GenerateResponsePayload:
+    __slots__ = ("result",)
+
     result: str
 
     def __init__(self, data: dict):
         self.result = data.get("msg")  # type: ignore
 
 
+class GenerateBatchResponsePayload:
+    __slots__ = ("results",)
+
+    results: List[str]
+
+    def __init__(self, data: dict):
+        self.results = data.get("msgs")  # type: ignore
+
+
 class CustomInfoResponsePayload:
+    __slots__ = ("id", "title", "description", "format")
+
     id: int
     title: str
     description: str
@@ -113,6 +155,8 @@ class CustomInfoResponsePayload:
 
 
 class Response:
+    __slots__ = ("uuid", "command", "status", "payload")
+
     uuid: str
     command: str
     status: str
@@ -138,3 +182,11 @@ class Response:
             data.get("status"),  # type: ignore
             data.get("payload"),  # type: ignore
         )
+
+    def to_dict(self) -> dict:
+        return {
+            "uuid": self.uuid,
+            "command": self.command,
+            "status": self.status,
+            "payload": self.payload,
+        }
@@ -0,0 +1,242 @@
+"""Metrics in Prometheus text format, served on /metrics"""
+
+import asyncio
+import logging
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, Iterable, Sequence, TypeVar
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if len(pairs) > 0 else ""
+
+
+class Counter:
+    name: str
+    help: str
+    labelnames: Sequence[str]
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+            )
+        return lines
+
+
+class Histogram:
+    name: str
+    help: str
+    labelnames: Sequence[str]
+    buckets: Sequence[float]
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # Per labels: count in each bucket (not cumulative), sum, count
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = ([0] * len(self.buckets), [0.0, 0.0])
+            self._values[labels] = entry
+
+        counts, totals = entry
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = [*self.labelnames, "le"]
+        for labels, (counts, (total, count)) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(names, [*labels, str(bound)])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _format_labels(names, [*labels, "+Inf"])
+            lines.append(f"{self.name}_bucket{inf_labels} {int(count)}")
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {int(count)}")
+        return lines
+
+
+class Callback:
+    """Value read on every scrape, e.g. length of a queue or a counter of a class"""
+
+    name: str
+    help: str
+    type: str
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], float],
+        type: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+
+    def render(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+            f"{self.name} {self.fn()}",
+        ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, Counter | Histogram | Callback] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        counter = Counter(name, help, labelnames)
+        self._metrics[name] = counter
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, help, labelnames, buckets)
+        self._metrics[name] = histogram
+        return histogram
+
+    def callback(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], float],
+        type: str = "gauge",
+    ) -> Callback:
+        """Register or replace value read on scrape"""
+        callback = Callback(name, help, fn, type)
+        self._metrics[name] = callback
+        return callback
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Failed to render %s", metric.name)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_duration = registry.histogram(
+    "bot_handler_duration_seconds",
+    "Time spent in a Telegram update handler",
+    ["handler"],
+)
+mq_request_duration = registry.histogram(
+    "bot_mq_request_duration_seconds",
+    "Time from request publish to its reply",
+    ["command"],
+)
+mq_publish_duration = registry.histogram(
+    "bot_mq_publish_duration_seconds",
+    "Time to publish a request",
+    ["command"],
+)
+mq_responses = registry.counter(
+    "bot_mq_responses_total",
+    "Replies received, by status",
+    ["command", "status"],
+)
+mq_orphaned_replies = registry.counter(
+    "bot_mq_orphaned_replies_total",
+    "Replies nobody waits for anymore",
+)
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Observe handler duration"""
+
+    def decorator(fn: F) -> F:
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                handler_duration.observe(time.perf_counter() - start, name)
+
+        return wrapper  # type: ignore
+
+    return decorator
+
+
+async def serve_metrics(host: str, port: int) -> asyncio.AbstractServer:
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1] == "/metrics":
+                status = "200 OK"
+                body = registry.render().encode()
+            else:
+                status = "404 Not Found"
+                body = b""
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -1,69 +1,281 @@
-from asyncio import AbstractEventLoop, Future
+import asyncio
+import logging
+from typing import Optional
 
 import orjson
-from aio_pika import Message, connect_robust
-from aio_pika.abc import AbstractExchange, AbstractQueue, AbstractRobustConnection
+from aio_pika import Message, connect
+from aio_pika.abc import (
+    AbstractConnection,
+    AbstractExchange,
+    AbstractIncomingMessage,
+    AbstractQueue,
+)
 
 from randomall_tg_bot.messages import (
     COMMAND_CUSTOM_INFO,
     COMMAND_CUSTOM_RESULT_MULTI,
     COMMAND_CUSTOM_RESULT_SINGLE,
     COMMAND_GENERAL_RESULT,
+    COMMAND_GENERAL_RESULT_BATCH,
     CustomRequestPayload,
     CustomWithButtonIdRequestPayload,
+    GeneralBatchRequestPayload,
     GeneralRequestPayload,
     Request,
     Response,
 )
+from randomall_tg_bot.metrics import (
+    mq_orphaned_replies,
+    mq_request_duration,
+    mq_responses,
+)
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import (
+    CHANNEL_SELECTION_LEAST_BUSY,
+    PUBLISH_POLICY_BLOCK,
+    ChannelPool,
+    Publisher,
+)
 
 QUEUE_TELEGRAM_REQUEST = "telegram_request"
 QUEUE_TELEGRAM_RESPONSE = "telegram_response"
+EXCHANGE_TELEGRAM_REQUEST = "telegram_request_exchange"
+
+# Replies are acked together with `multiple`, or not at all with no_ack
+ACK_MODE_BATCH = "batch"
+ACK_MODE_AUTO = "auto"
+
+logger = logging.getLogger(__name__)
+
+
+class MQDisconnectedError(Exception):
+    """Connection to RabbitMQ is lost, the request will not be answered"""
 
 
 class MQ:
-    connection: AbstractRobustConnection
+    """
+    Requests and replies over one connection. `connect` declares the exchange
+    and queues, and is called again by `MQSupervisor` after the connection is
+    lost. While disconnected, requests fail with `MQDisconnectedError`.
+
+    With `rpc` every process consumes its own exclusive auto-delete reply queue,
+    whose name is sent in `reply_to`, otherwise the shared durable
+    `telegram_response` queue is used.
+    Requests are published by `MQ.publisher`, its `run` must be running, on a
+    pool of `publish_channels` channels.
+    At most `prefetch_count` replies are delivered unacked, 0 is unlimited.
+    """
+
+    amqp_url: str
+    rpc: bool
+    publisher_confirms: bool
+    prefetch_count: int
+
+    connection: Optional[AbstractConnection]
     request_queue: AbstractQueue
     response_queue: AbstractQueue
     request_exchange: AbstractExchange
 
-    uuids_map: dict[str, Future[Response]]
+    pending: PendingRequests
+    publisher: Publisher
+
+    ack_mode: str
+    ack_batch_size: int
+    ack_interval: float
 
     def __init__(
         self,
-        connection: AbstractRobustConnection,
-        request_queue: AbstractQueue,
-        response_queue: AbstractQueue,
-        request_exchange: AbstractExchange,
-        uuids_map: dict[str, Future[Response]],
+        amqp_url: str,
+        pending: PendingRequests,
+        rpc: bool = False,
+        publisher_confirms: bool = True,
+        publish_queue_size: int = 1000,
+        publish_policy: str = PUBLISH_POLICY_BLOCK,
+        publish_batch_size: int = 100,
+        publish_channels: int = 1,
+        publish_channel_selection: str = CHANNEL_SELECTION_LEAST_BUSY,
+        prefetch_count: int = 256,
+        ack_mode: str = ACK_MODE_BATCH,
+        ack_batch_size: int = 64,
+        ack_interval: float = 0.05,
     ) -> None:
+        self.amqp_url = amqp_url
+        self.rpc = rpc
+        self.publisher_confirms = publisher_confirms
+        self.prefetch_count = prefetch_count
+        self.pending = pending
+        self.publisher = Publisher(
+            ChannelPool(
+                publish_channels,
+                publish_channel_selection,
+                EXCHANGE_TELEGRAM_REQUEST,
+                publisher_confirms,
+            ),
+            QUEUE_TELEGRAM_REQUEST,
+            pending,
+            publish_queue_size,
+            publish_policy,
+            publish_batch_size,
+        )
+        self.ack_mode = ack_mode
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+
+        self.connection = None
+        self._closed: Optional[asyncio.Future[None]] = None
+
+        self._ack_last: Optional[AbstractIncomingMessage] = None
+        self._ack_count = 0
+        self._ack_timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def connected(self) -> bool:
+        return self._closed is not None and not self._closed.done()
+
+    async def connect(self) -> None:
+        """Open connection, declare exchange and queues"""
+        loop = asyncio.get_running_loop()
+        connection = await connect(self.amqp_url)
+        try:
+            # Creating channels
+            channel_a = await connection.channel(
+                publisher_confirms=self.publisher_confirms
+            )
+            channel_b = await connection.channel()
+            if self.prefetch_count > 0:
+                await channel_b.set_qos(prefetch_count=self.prefetch_count)
+
+            # Creating exchange
+            request_exchange = await channel_a.declare_exchange(
+                EXCHANGE_TELEGRAM_REQUEST
+            )
+
+            # Declaring queues
+            request_queue = await channel_a.declare_queue(QUEUE_TELEGRAM_REQUEST)
+            await request_queue.bind(request_exchange, QUEUE_TELEGRAM_REQUEST)
+
+            if self.rpc:
+                # Server-named queue, dropped together with the connection
+                response_queue = await channel_b.declare_queue(
+                    exclusive=True, auto_delete=True
+                )
+            else:
+                response_queue = await channel_b.declare_queue(QUEUE_TELEGRAM_RESPONSE)
+
+            await self.publisher.pool.open(connection, channel_a)
+        except BaseException:
+            await connection.close()
+            raise
+
+        closed: asyncio.Future[None] = loop.create_future()
+
+        def on_close(*_) -> None:
+            if not closed.done():
+                closed.set_result(None)
+
+        connection.close_callbacks.add(on_close)
+
         self.connection = connection
         self.request_queue = request_queue
         self.response_queue = response_queue
         self.request_exchange = request_exchange
-        self.uuids_map = uuids_map
+        self._closed = closed
+        # Delivery tags of the old channel are meaningless now
+        self._ack_last = None
+        self._ack_count = 0
+
+    def disconnected(self) -> None:
+        """Fail everything waiting for the lost connection"""
+        self._closed = None
+        error = MQDisconnectedError("Connection to RabbitMQ is lost")
+        self.publisher.clear()
+        self.pending.fail_all(error)
+
+    @property
+    def reply_to(self) -> str:
+        return self.response_queue.name
 
     async def recv(self) -> None:
-        async with self.response_queue.iterator() as queue_iter:
-            async for message in queue_iter:
-                async with message.process():
-                    data = orjson.loads(message.body)
-                    uuid = data.get("uuid")
-
-                    try:
-                        result_future = self.uuids_map.pop(uuid)
-                        response = Response.from_dict(data)
-                        result_future.set_result(response)
-                    except KeyError:
-                        continue
+        """Consume replies until the connection is closed"""
+        assert self._closed is not None
+        await self.response_queue.consume(
+            self._on_message, no_ack=self.ack_mode == ACK_MODE_AUTO
+        )
+        await asyncio.shield(self._closed)
+
+    async def _on_message(self, message: AbstractIncomingMessage) -> None:
+        try:
+            self._dispatch(message)
+        except Exception:
+            logger.exception("Failed to handle reply %s", message.correlation_id)
+
+        if self.ack_mode == ACK_MODE_AUTO:
+            return
+
+        last = self._ack_last
+        if last is None or message.delivery_tag > last.delivery_tag:
+            self._ack_last = message
+        self._ack_count += 1
+
+        if self._ack_count >= self.ack_batch_size:
+            await self._flush_acks()
+        elif self._ack_timer is None:
+            self._ack_timer = asyncio.get_running_loop().call_later(
+                self.ack_interval, lambda: asyncio.ensure_future(self._flush_acks())
+            )
+
+    def _dispatch(self, message: AbstractIncomingMessage) -> None:
+        data = None
+        uuid = message.correlation_id
+        if uuid is None:
+            # Responder does not copy correlation_id, fall back to body
+            data = orjson.loads(message.body)
+            uuid = data.get("uuid")
+
+        age = self.pending.age(uuid)
+        if age is None:
+            logger.debug("Dropping reply for unknown uuid %s", uuid)
+            mq_orphaned_replies.inc()
+            return
+
+        if data is None:
+            data = orjson.loads(message.body)
+        response = Response.from_dict(data)
+        mq_request_duration.observe(age, response.command)
+        mq_responses.inc(response.command, response.status)
+        self.pending.resolve(uuid, response)
+
+    async def _flush_acks(self) -> None:
+        """Ack every reply received so far with one frame"""
+        if self._ack_timer is not None:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+
+        message = self._ack_last
+        if message is None:
+            return
+        self._ack_last = None
+        self._ack_count = 0
+        try:
+            await message.ack(multiple=True)
+        except Exception as e:
+            # Unacked replies are redelivered and dropped as orphaned
+            logger.warning("Failed to ack replies: %r", e)
 
     async def close(self) -> None:
-        await self.connection.close()
+        if self.connection is not None:
+            await self.connection.close()
 
     async def general_result(self, uuid: str, name: str) -> None:
         payload = GeneralRequestPayload(name)
         request = Request(uuid, COMMAND_GENERAL_RESULT, payload.to_dict())
         await self._make_request(request)
 
+    async def general_result_batch(self, uuid: str, name: str, count: int) -> None:
+        payload = GeneralBatchRequestPayload(name, count)
+        request = Request(uuid, COMMAND_GENERAL_RESULT_BATCH, payload.to_dict())
+        await self._make_request(request)
+
     async def custom_info(self, uuid: str, id: int) -> None:
         payload = CustomRequestPayload(id)
         request = Request(uuid, COMMAND_CUSTOM_INFO, payload.to_dict())
@@ -85,35 +297,18 @@ class MQ:
         await self._make_request(request)
 
     async def _make_request(self, request: Request) -> None:
+        """
+        Hand request to the publisher,
+        raises PublishRejectedError or MQDisconnectedError
+        """
+        if not self.connected:
+            raise MQDisconnectedError("Not connected to RabbitMQ")
+
         message = Message(
             orjson.dumps(request.to_dict()),
             content_type="text/plain",
             expiration=10,
+            correlation_id=request.uuid,
+            reply_to=self.reply_to,
         )
-        await self.request_exchange.publish(
-            message,
-            routing_key=QUEUE_TELEGRAM_REQUEST,
-        )
-
-
-async def create_mq(
-    loop: AbstractEventLoop,
-    amqp_url: str,
-    uuids_map: dict[str, Future],
-) -> MQ:
-    connection = await connect_robust(amqp_url, loop=loop)
-
-    # Creating channels
-    channel_a = await connection.channel()
-    channel_b = await connection.channel()
-
-    # Creating exchange
-    request_exchange = await channel_a.declare_exchange("telegram_request_exchange")
-
-    # Declaring queues
-    request_queue = await channel_a.declare_queue(QUEUE_TELEGRAM_REQUEST)
-    await request_queue.bind(request_exchange, QUEUE_TELEGRAM_REQUEST)
-
-    response_queue = await channel_b.declare_queue(QUEUE_TELEGRAM_RESPONSE)
-
-    return MQ(connection, request_queue, response_queue, request_exchange, uuids_map)
+        await self.publisher.submit(request.uuid, request.command, message)
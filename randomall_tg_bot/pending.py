@@ -0,0 +1,132 @@
+import asyncio
+import heapq
+from typing import Optional
+from uuid import uuid4
+
+from randomall_tg_bot.messages import Response
+
+
+class PendingRequests:
+    """
+    Futures of requests waiting for a reply, keyed by uuid.
+    All deadlines share one heap and one timer handle: expired futures get
+    `TimeoutError` in bulk, so callers can simply await them.
+    """
+
+    resolution: float
+    expired: int
+
+    def __init__(self, resolution: float = 0.05) -> None:
+        # Deadlines closer than `resolution` expire together
+        self.resolution = resolution
+        self._entries: dict[str, tuple[asyncio.Future[Response], float]] = {}
+        self._deadlines: list[tuple[float, str]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at = 0.0
+        self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._entries
+
+    def create(self, timeout: float) -> tuple[str, asyncio.Future[Response]]:
+        """Return uuid and future, which fails with TimeoutError after `timeout`"""
+        loop = asyncio.get_running_loop()
+        uuid = str(uuid4())
+        future: asyncio.Future[Response] = loop.create_future()
+        now = loop.time()
+        deadline = now + timeout
+
+        self._entries[uuid] = (future, now)
+        heapq.heappush(self._deadlines, (deadline, uuid))
+        if self._timer is None or deadline + self.resolution < self._timer_at:
+            self._schedule(loop, deadline)
+
+        return uuid, future
+
+    def age(self, uuid: str) -> Optional[float]:
+        """Seconds since the request was created, None if it is unknown"""
+        entry = self._entries.get(uuid)
+        if entry is None:
+            return None
+        return asyncio.get_running_loop().time() - entry[1]
+
+    def resolve(self, uuid: str, response: Response) -> bool:
+        """Set result, False if nobody waits for this uuid"""
+        entry = self._entries.pop(uuid, None)
+        if entry is None:
+            return False
+
+        future, _ = entry
+        if future.done():
+            return False
+
+        future.set_result(response)
+        return True
+
+    def fail(self, uuid: str, exc: BaseException) -> bool:
+        """Set exception, False if nobody waits for this uuid"""
+        entry = self._entries.pop(uuid, None)
+        if entry is None:
+            return False
+
+        future, _ = entry
+        if future.done():
+            return False
+
+        future.set_exception(exc)
+        return True
+
+    def discard(self, uuid: str) -> None:
+        """Forget uuid, its heap entry is dropped lazily"""
+        self._entries.pop(uuid, None)
+
+    async def join(self, timeout: float) -> bool:
+        """Wait until nothing is in flight, False if requests are left after `timeout`"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(self._entries) > 0:
+            if loop.time() >= deadline:
+                return False
+            await asyncio.sleep(self.resolution)
+        return True
+
+    def fail_all(self, exc: BaseException) -> None:
+        entries = self._entries
+        self._entries = {}
+        for future, _ in entries.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    def oldest_age(self) -> float:
+        """Seconds the oldest request is in flight, 0 if there are none"""
+        for _, created_at in self._entries.values():
+            return asyncio.get_running_loop().time() - created_at
+        return 0.0
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, deadline: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = deadline + self.resolution
+        self._timer = loop.call_at(self._timer_at, self._expire)
+
+    def _expire(self) -> None:
+        self._timer = None
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        deadlines = self._deadlines
+
+        while len(deadlines) > 0 and deadlines[0][0] <= now:
+            _, uuid = heapq.heappop(deadlines)
+            entry = self._entries.pop(uuid, None)
+            if entry is not None and not entry[0].done():
+                entry[0].set_exception(asyncio.exceptions.TimeoutError())
+                self.expired += 1
+
+        if len(self._entries) == 0:
+            # Everything left in the heap was already resolved
+            deadlines.clear()
+        elif len(deadlines) > 0:
+            self._schedule(loop, deadlines[0][0])
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Iterable, Optional
+
+from randomall_tg_bot.messages import (
+    COMMAND_GENERAL_RESULT,
+    RESPONSE_STATUS_NOT_IMPLEMENTED,
+    RESPONSE_STATUS_OK,
+    GenerateBatchResponsePayload,
+    Response,
+)
+from randomall_tg_bot.mq import MQ, MQDisconnectedError
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import PublishRejectedError
+
+logger = logging.getLogger(__name__)
+
+
+class GeneralPrefetcher:
+    """
+    Keeps a small buffer of ready general results per target.
+    Buffers below `watermark` are topped up to `size` by `run`, with one
+    `general_result_batch` request per target while the backend supports it.
+    """
+
+    batch: bool
+    size: int
+    watermark: int
+    interval: float
+    timeout: float
+
+    def __init__(
+        self,
+        mq: MQ,
+        pending: PendingRequests,
+        targets: Iterable[str],
+        size: int,
+        watermark: int,
+        interval: float,
+        timeout: float,
+    ) -> None:
+        self.mq = mq
+        self.pending = pending
+        self.size = size
+        self.watermark = watermark
+        self.interval = interval
+        self.timeout = timeout
+        self.batch = True
+        self.buffers: dict[str, deque[Response]] = {
+            target: deque(maxlen=size) for target in targets
+        }
+        self._wakeup = asyncio.Event()
+
+    def take(self, target: str) -> Optional[Response]:
+        """Return prefetched response or None if target is disabled or drained"""
+        buffer = self.buffers.get(target)
+        if not buffer:
+            return None
+
+        response = buffer.popleft()
+        if len(buffer) <= self.watermark:
+            self._wakeup.set()
+        return response
+
+    async def run(self) -> None:
+        if self.size <= 0:
+            return
+
+        while True:
+            self._wakeup.clear()
+            targets = [
+                target
+                for target, buffer in self.buffers.items()
+                if len(buffer) <= self.watermark
+            ]
+            if len(targets) > 0:
+                await asyncio.gather(*(self._refill(target) for target in targets))
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.exceptions.TimeoutError:
+                pass
+
+    async def _refill(self, target: str) -> None:
+        buffer = self.buffers[target]
+        count = self.size - len(buffer)
+        if count <= 0:
+            return
+
+        # A failed target must not stop the others or the `run` loop
+        try:
+            if self.batch:
+                await self._refill_batch(target, count)
+            else:
+                await self._refill_single(target, count)
+        except Exception:
+            logger.exception("Failed to prefetch %s", target)
+
+    async def _refill_batch(self, target: str, count: int) -> None:
+        uuid, future = self.pending.create(self.timeout)
+
+        try:
+            await self.mq.general_result_batch(uuid, target, count)
+            response = await future
+        except (
+            asyncio.exceptions.TimeoutError,
+            PublishRejectedError,
+            MQDisconnectedError,
+        ):
+            return
+        except Exception:
+            logger.exception("Failed to prefetch %s", target)
+            return
+        finally:
+            self.pending.discard(uuid)
+
+        if response.status == RESPONSE_STATUS_OK:
+            results = (
+                GenerateBatchResponsePayload(response.payload).results
+                if response.payload is not None
+                else None
+            )
+            if isinstance(results, list):
+                self.buffers[target].extend(
+                    Response(
+                        uuid, COMMAND_GENERAL_RESULT, RESPONSE_STATUS_OK, {"msg": msg}
+                    )
+                    for msg in results
+                )
+                return
+
+            logger.warning(
+                "Batch prefetch of %s returned no results, prefetching one by one",
+                target,
+            )
+            await self._refill_single(target, count)
+        elif response.status == RESPONSE_STATUS_NOT_IMPLEMENTED:
+            logger.info("Batch requests are not supported, prefetching one by one")
+            self.batch = False
+            await self._refill_single(target, count)
+        else:
+            logger.warning(
+                "Batch prefetch of %s failed with %s, prefetching one by one",
+                target,
+                response.status,
+            )
+            await self._refill_single(target, count)
+
+    async def _refill_single(self, target: str, count: int) -> None:
+        requests = [self.pending.create(self.timeout) for _ in range(count)]
+
+        try:
+            for uuid, _ in requests:
+                await self.mq.general_result(uuid, target)
+
+            # Every future is either resolved or expired by the deadline
+            await asyncio.wait([future for _, future in requests])
+            for _, future in requests:
+                if future.exception() is not None:
+                    continue
+                response = future.result()
+                if response.status == RESPONSE_STATUS_OK:
+                    self.buffers[target].append(response)
+        except (PublishRejectedError, MQDisconnectedError):
+            pass
+        except Exception:
+            logger.exception("Failed to prefetch %s", target)
+        finally:
+            for uuid, _ in requests:
+                self.pending.discard(uuid)
@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aio_pika import Message
+from aio_pika.abc import AbstractChannel, AbstractConnection, AbstractExchange
+
+from randomall_tg_bot.metrics import mq_publish_duration
+from randomall_tg_bot.pending import PendingRequests
+
+PUBLISH_POLICY_BLOCK = "block"
+PUBLISH_POLICY_SHED = "shed"
+PUBLISH_POLICY_FAIL = "fail"
+
+CHANNEL_SELECTION_ROUND_ROBIN = "round_robin"
+CHANNEL_SELECTION_LEAST_BUSY = "least_busy"
+
+logger = logging.getLogger(__name__)
+
+
+class PublishRejectedError(Exception):
+    """Request was not published, the caller should answer with an error"""
+
+
+class PublishChannel:
+    """Channel of the pool, `busy` is the number of publishes not confirmed yet"""
+
+    __slots__ = ("channel", "exchange", "busy")
+
+    def __init__(self, channel: AbstractChannel, exchange: AbstractExchange) -> None:
+        self.channel = channel
+        self.exchange = exchange
+        self.busy = 0
+
+
+class ChannelPool:
+    """
+    Requests are spread over `size` channels: the broker handles publishes of a
+    channel one by one, and every channel confirms on its own. The channel is
+    picked in turn (`round_robin`) or with the fewest unconfirmed publishes
+    (`least_busy`). A closed channel is skipped and opened again in the
+    background, the others keep publishing.
+    """
+
+    size: int
+    selection: str
+    exchange_name: str
+    publisher_confirms: bool
+
+    channels: list[PublishChannel]
+    replaced: int
+
+    def __init__(
+        self,
+        size: int,
+        selection: str,
+        exchange_name: str,
+        publisher_confirms: bool,
+    ) -> None:
+        self.size = max(size, 1)
+        self.selection = selection
+        self.exchange_name = exchange_name
+        self.publisher_confirms = publisher_confirms
+
+        self.channels = []
+        self.replaced = 0
+        self._connection: Optional[AbstractConnection] = None
+        self._next = 0
+        # index -> task opening the channel again
+        self._replacing: dict[int, asyncio.Task[None]] = {}
+
+    @property
+    def open_channels(self) -> int:
+        return sum(1 for c in self.channels if not c.channel.is_closed)
+
+    async def open(
+        self, connection: AbstractConnection, first: AbstractChannel
+    ) -> None:
+        """Open the pool on a new connection, `first` is already open"""
+        self._connection = connection
+        channels = [PublishChannel(first, await self._get_exchange(first))]
+        while len(channels) < self.size:
+            channels.append(await self._open_channel())
+
+        self.channels = channels
+        self._replacing.clear()
+
+    async def publish(self, message: Message, routing_key: str) -> None:
+        """Raises PublishRejectedError if every channel is closed"""
+        channel = self._select()
+        channel.busy += 1
+        try:
+            await channel.exchange.publish(message, routing_key=routing_key)
+        finally:
+            channel.busy -= 1
+            if channel.channel.is_closed:
+                self._replace(channel)
+
+    def _select(self) -> PublishChannel:
+        selected = None
+        channels = self.channels
+        if self.selection == CHANNEL_SELECTION_LEAST_BUSY:
+            for channel in channels:
+                if channel.channel.is_closed:
+                    self._replace(channel)
+                elif selected is None or channel.busy < selected.busy:
+                    selected = channel
+        else:
+            for _ in range(len(channels)):
+                channel = channels[self._next % len(channels)]
+                self._next += 1
+                if not channel.channel.is_closed:
+                    selected = channel
+                    break
+                self._replace(channel)
+
+        if selected is None:
+            raise PublishRejectedError("Every publish channel is closed")
+        return selected
+
+    def _replace(self, channel: PublishChannel) -> None:
+        try:
+            index = self.channels.index(channel)
+        except ValueError:
+            # Pool was opened on a new connection meanwhile
+            return
+        if index not in self._replacing:
+            self._replacing[index] = asyncio.ensure_future(self._reopen(index, channel))
+
+    async def _reopen(self, index: int, old: PublishChannel) -> None:
+        try:
+            channel = await self._open_channel()
+        except Exception as e:
+            # Tried again when the channel is selected next time
+            logger.warning("Failed to open publish channel: %r", e)
+            return
+        finally:
+            self._replacing.pop(index, None)
+
+        if index < len(self.channels) and self.channels[index] is old:
+            self.channels[index] = channel
+            self.replaced += 1
+        else:
+            await channel.channel.close()
+
+    async def _open_channel(self) -> PublishChannel:
+        assert self._connection is not None
+        channel = await self._connection.channel(
+            publisher_confirms=self.publisher_confirms
+        )
+        return PublishChannel(channel, await self._get_exchange(channel))
+
+    async def _get_exchange(self, channel: AbstractChannel) -> AbstractExchange:
+        # Declared by MQ.connect already
+        return await channel.get_exchange(self.exchange_name, ensure=False)
+
+
+class Publisher:
+    """
+    Handlers only put requests into a bounded buffer, one task publishes them.
+    Everything buffered is published at once, so the frames go out together
+    and confirms of the whole batch are awaited concurrently.
+    When the buffer is full, depending on `policy` the caller waits (`block`),
+    the oldest buffered request is dropped (`shed`) or the new one is rejected
+    (`fail`). Dropped requests fail with `PublishRejectedError` right away
+    instead of timing out.
+    """
+
+    pool: ChannelPool
+    routing_key: str
+    pending: PendingRequests
+    policy: str
+    batch_size: int
+
+    published: int
+    shed: int
+    rejected: int
+    failed: int
+
+    def __init__(
+        self,
+        pool: ChannelPool,
+        routing_key: str,
+        pending: PendingRequests,
+        queue_size: int,
+        policy: str,
+        batch_size: int,
+    ) -> None:
+        self.pool = pool
+        self.routing_key = routing_key
+        self.pending = pending
+        self.policy = policy
+        self.batch_size = max(batch_size, 1)
+        self._queue: asyncio.Queue[tuple[str, str, Message]] = asyncio.Queue(queue_size)
+
+        self.published = 0
+        self.shed = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, uuid: str, command: str, message: Message) -> None:
+        """Buffer request, raises PublishRejectedError with `fail` policy"""
+        item = (uuid, command, message)
+        if self.policy == PUBLISH_POLICY_BLOCK:
+            await self._queue.put(item)
+            return
+
+        if self._queue.full():
+            if self.policy == PUBLISH_POLICY_SHED:
+                shed_uuid, _, _ = self._queue.get_nowait()
+                self.pending.fail(shed_uuid, PublishRejectedError("Request shed"))
+                self.shed += 1
+            else:
+                self.rejected += 1
+                raise PublishRejectedError("Publish buffer is full")
+
+        self._queue.put_nowait(item)
+
+    def clear(self) -> None:
+        """Drop buffered requests"""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    async def run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            await asyncio.gather(*(self._publish(*item) for item in batch))
+
+    async def _publish(self, uuid: str, command: str, message: Message) -> None:
+        start = time.perf_counter()
+        try:
+            await self.pool.publish(message, self.routing_key)
+        except Exception as e:
+            logger.warning("Failed to publish %s %s: %r", command, uuid, e)
+            self.failed += 1
+            self.pending.fail(uuid, PublishRejectedError(str(e)))
+            return
+
+        mq_publish_duration.observe(time.perf_counter() - start, command)
+        self.published += 1
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Coroutine, Optional, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+Result = Union[bool, dict, list]
+
+# Idle chat buckets are dropped once there are this many
+CHAT_BUCKETS_PRUNE_SIZE = 10_000
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts up to `capacity`"""
+
+    rate: float
+    capacity: float
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # Lock is fair, waiters get tokens in order of arrival
+        self._lock = asyncio.Lock()
+
+    def is_idle(self) -> bool:
+        return not self._lock.locked() and self._refill() >= self.capacity
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            tokens = self._refill()
+            if tokens < 1:
+                await asyncio.sleep((1 - tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+        return self.tokens
+
+
+class SendScheduler(BaseRateLimiter):
+    """
+    Rate limiter for every Bot API call of the application.
+    Requests to a chat take a token from the global and the chat bucket,
+    others (e.g. answerCallbackQuery) are not delayed. On `RetryAfter` all
+    requests wait for the given time and the request is retried.
+    """
+
+    global_rate: float
+    chat_rate: float
+    chat_burst: int
+    max_retries: int
+
+    sent: int
+    retries: int
+    waiting: int
+
+    def __init__(
+        self,
+        global_rate: float,
+        chat_rate: float,
+        chat_burst: int,
+        max_retries: int,
+    ) -> None:
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: dict[int | str, TokenBucket] = {}
+        # `time.monotonic()` until which no request is sent after a flood limit
+        self._resume_at = 0.0
+
+        self.sent = 0
+        self.retries = 0
+        self.waiting = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chat_buckets.clear()
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Result]],
+        args: Any,
+        kwargs: dict[str, Any],
+        endpoint: str,
+        data: dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Result:
+        max_retries = (
+            rate_limit_args if rate_limit_args is not None else self.max_retries
+        )
+        chat_id = data.get("chat_id")
+
+        for i in range(max_retries + 1):
+            self.waiting += 1
+            try:
+                await self._wait_resume()
+                if chat_id is not None:
+                    await self._chat_bucket(chat_id).acquire()
+                    await self._global_bucket.acquire()
+            finally:
+                self.waiting -= 1
+
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as exc:
+                if i == max_retries:
+                    raise
+
+                self.retries += 1
+                logger.info(
+                    "%s hit flood limit, retry in %ss", endpoint, exc.retry_after
+                )
+                self._resume_at = max(
+                    self._resume_at, time.monotonic() + exc.retry_after
+                )
+
+        raise AssertionError("unreachable")
+
+    async def _wait_resume(self) -> None:
+        """Sleeps until the latest flood limit is over"""
+        while (delay := self._resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= CHAT_BUCKETS_PRUNE_SIZE:
+                self._chat_buckets = {
+                    key: value
+                    for key, value in self._chat_buckets.items()
+                    if not value.is_idle()
+                }
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
@@ -0,0 +1,214 @@
+import asyncio
+import math
+from collections import deque
+from typing import Awaitable, Callable, Hashable, Optional
+
+from randomall_tg_bot.cache import TTLCache
+from randomall_tg_bot.messages import Response
+from randomall_tg_bot.mq import MQDisconnectedError
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import PublishRejectedError
+
+# Hedges that can be sent in a row when the budget was saved up
+MAX_HEDGE_BURST = 10.0
+
+
+class LatencyWindow:
+    """Last `size` latencies, sorted again only when a quantile is read"""
+
+    __slots__ = ("samples", "_sorted", "_dirty")
+
+    def __init__(self, size: int) -> None:
+        self.samples: deque[float] = deque(maxlen=size)
+        self._sorted: list[float] = []
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def observe(self, latency: float) -> None:
+        self.samples.append(latency)
+        self._dirty = True
+
+    def quantile(self, q: float) -> float:
+        if self._dirty:
+            self._sorted = sorted(self.samples)
+            self._dirty = False
+        return self._sorted[min(int(q * len(self._sorted)), len(self._sorted) - 1)]
+
+
+class Requester:
+    """
+    MQ round trips with timeouts adapted to the latency observed recently for
+    the generator, or for the command while the generator has few samples:
+    `timeout_multiplier` times p99, between `min_timeout` and `max_timeout`.
+    0 multiplier always waits `max_timeout`.
+
+    With `hedge_quantile`, a request without a reply by that quantile is sent
+    once more with a new uuid, the first reply wins and the other one is
+    dropped as orphaned by MQ. Hedges are paid from a budget that grows by
+    `hedge_budget` with every request, so at most that share is sent twice.
+    """
+
+    pending: PendingRequests
+    max_timeout: float
+    min_timeout: float
+    timeout_multiplier: float
+    hedge_quantile: float
+    hedge_budget: float
+    min_samples: int
+
+    requests: int
+    hedged: int
+    hedge_wins: int
+
+    def __init__(
+        self,
+        pending: PendingRequests,
+        max_timeout: float,
+        min_timeout: float = 1.0,
+        timeout_multiplier: float = 0.0,
+        hedge_quantile: float = 0.0,
+        hedge_budget: float = 0.05,
+        min_samples: int = 20,
+        window: int = 256,
+        max_generators: int = 1024,
+    ) -> None:
+        self.pending = pending
+        self.max_timeout = max_timeout
+        self.min_timeout = min_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.min_samples = min_samples
+        self.window = window
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+        self._budget = 0.0
+        self._commands: dict[str, LatencyWindow] = {}
+        # (command, generator) -> latencies
+        self._generators: TTLCache[tuple, LatencyWindow] = TTLCache(
+            max_generators, math.inf
+        )
+
+    async def request(
+        self,
+        command: str,
+        generator: Hashable,
+        send: Callable[[str], Awaitable[None]],
+    ) -> Response:
+        """
+        Publish with `send(uuid)` and wait for the reply,
+        raises TimeoutError, PublishRejectedError or MQDisconnectedError
+        """
+        loop = asyncio.get_running_loop()
+        key = (command, generator)
+        timeout = self.timeout(command, key)
+        hedge_delay = self.hedge_delay(command, key)
+
+        self.requests += 1
+        self._budget = min(self._budget + self.hedge_budget, MAX_HEDGE_BURST)
+
+        start = loop.time()
+        uuid, future = self.pending.create(timeout)
+        uuids = [uuid]
+        try:
+            await send(uuid)
+
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait([future], timeout=hedge_delay)
+                if not done and self._budget >= 1:
+                    self._budget -= 1
+                    self.hedged += 1
+                    hedge_uuid, hedge_future = self.pending.create(
+                        timeout - (loop.time() - start)
+                    )
+                    uuids.append(hedge_uuid)
+                    future = await self._hedge(send, hedge_uuid, future, hedge_future)
+
+            response = await future
+            self._observe(command, key, loop.time() - start)
+            return response
+        except asyncio.exceptions.TimeoutError:
+            self._observe(command, key, loop.time() - start)
+            raise
+        finally:
+            for uuid in uuids:
+                self.pending.discard(uuid)
+
+    def timeout(self, command: str, key: tuple) -> float:
+        if self.timeout_multiplier <= 0:
+            return self.max_timeout
+
+        window = self._window(command, key)
+        if window is None:
+            return self.max_timeout
+
+        timeout = window.quantile(0.99) * self.timeout_multiplier
+        return min(max(timeout, self.min_timeout), self.max_timeout)
+
+    def hedge_delay(self, command: str, key: tuple) -> Optional[float]:
+        if self.hedge_quantile <= 0:
+            return None
+
+        window = self._window(command, key)
+        if window is None:
+            return None
+        return window.quantile(self.hedge_quantile)
+
+    async def _hedge(
+        self,
+        send: Callable[[str], Awaitable[None]],
+        hedge_uuid: str,
+        future: asyncio.Future[Response],
+        hedge_future: asyncio.Future[Response],
+    ) -> asyncio.Future[Response]:
+        """Send the hedge, return the future that was answered first"""
+        try:
+            await send(hedge_uuid)
+        except (PublishRejectedError, MQDisconnectedError):
+            # The first request may still be answered
+            return future
+
+        waiting = {future, hedge_future}
+        while True:
+            done, waiting = await asyncio.wait(
+                waiting, return_when=asyncio.FIRST_COMPLETED
+            )
+            failed = None
+            for winner in done:
+                if winner.exception() is None:
+                    if winner is hedge_future:
+                        self.hedge_wins += 1
+                    return winner
+                failed = winner
+            if len(waiting) == 0:
+                assert failed is not None
+                return failed
+
+    def _window(self, command: str, key: tuple) -> Optional[LatencyWindow]:
+        """Latencies of the generator, of the command if too few, None if both"""
+        window = self._generators.get(key)
+        if window is not None and len(window) >= self.min_samples:
+            return window
+
+        window = self._commands.get(command)
+        if window is not None and len(window) >= self.min_samples:
+            return window
+        return None
+
+    def _observe(self, command: str, key: tuple, latency: float) -> None:
+        window = self._generators.get(key)
+        if window is None:
+            window = LatencyWindow(self.window)
+            self._generators.set(key, window)
+        window.observe(latency)
+
+        window = self._commands.get(command)
+        if window is None:
+            window = LatencyWindow(self.window)
+            self._commands[command] = window
+        window.observe(latency)
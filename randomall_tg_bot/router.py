@@ -1,11 +1,21 @@
 import asyncio
-from typing import List
-from uuid import uuid4
+import logging
+import math
+from typing import Awaitable, Callable, List, Optional
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
 from telegram.constants import ParseMode
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
+from randomall_tg_bot.admission import AdmissionControl, BusyError
+from randomall_tg_bot.cache import TTLCache
+from randomall_tg_bot.callback_data import (
+    ACTION_FIRST,
+    ACTION_REPEAT,
+    CallbackData,
+    InvalidIdError,
+)
 from randomall_tg_bot.logger import Action, Event, log_event
 from randomall_tg_bot.messages import (
     BUTTONS_MODE_DEFAULT,
@@ -24,10 +34,25 @@ from randomall_tg_bot.messages import (
     GenerateResponsePayload,
     Response,
 )
-from randomall_tg_bot.mq import MQ
+from randomall_tg_bot.mq import MQ, MQDisconnectedError
+from randomall_tg_bot.prefetch import GeneralPrefetcher
+from randomall_tg_bot.publisher import PublishRejectedError
+from randomall_tg_bot.requester import Requester
 
 TIMEOUT = 10.0
 
+# Messages whose presses are tracked for dedupe, least recently pressed dropped
+PRESSED_MESSAGES_SIZE = 10000
+
+# Request failed without a reply, answered with SERVER_ERROR_MESSAGE
+REQUEST_ERRORS = (
+    asyncio.exceptions.TimeoutError,
+    PublishRejectedError,
+    MQDisconnectedError,
+)
+
+logger = logging.getLogger(__name__)
+
 HELP_MESSAGE = """*Официальный бот randomall\\.ru*
 Поддерживает встроенные и публичные пользовательские генераторы\\.
 
@@ -49,6 +74,7 @@ SERVER_ERROR_MESSAGE = "Серверная ошибка"
 GENERATOR_NOT_FOUND_MESSAGE = "Генератор не найден"
 FORBIDDEN_MESSAGE = "Приватный генератор"
 ID_MUST_BE_A_NUMBER_MESSAGE = "id должен быть числом"
+BUSY_MESSAGE = "Слишком много запросов, попробуйте позже"
 
 GENERAL: list[tuple[str, str]] = [
     ("Фэнтези имя", "fantasy_name"),
@@ -78,36 +104,20 @@ GENERAL: list[tuple[str, str]] = [
     ("Русский город", "cities"),
 ]
 
-ACTION_FIRST = "first"
-ACTION_REPEAT = "repeat"
 
-MODE_SINGLE = "single"
-MODE_MULTI = "multi"
+MARKDOWN_V2_SPECIAL = "_*[]()~`>#+-=|{}.!"
+MARKDOWN_V2_ESCAPES = [(ch, f"\\{ch}") for ch in MARKDOWN_V2_SPECIAL]
 
 
 def escape_text(text: str) -> str:
-    """MarkdownV2 escape"""
-    for ch in (
-        "_",
-        "*",
-        "[",
-        "]",
-        "(",
-        ")",
-        "~",
-        "`",
-        ">",
-        "#",
-        "+",
-        "-",
-        "=",
-        "|",
-        "{",
-        "}",
-        ".",
-        "!",
-    ):
-        text = text.replace(ch, f"\\{ch}")
+    """
+    MarkdownV2 escape.
+    `in` is much cheaper than `replace`, most texts only have a few of the
+    special characters. Single pass `translate` or `re.sub` are slower in CPython.
+    """
+    for ch, escaped in MARKDOWN_V2_ESCAPES:
+        if ch in text:
+            text = text.replace(ch, escaped)
     return text
 
 
@@ -115,7 +125,10 @@ def get_general_first_markup() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup.from_column(
         [
             InlineKeyboardButton(
-                name, callback_data=f"{COMMAND_GENERAL_RESULT}:{ACTION_FIRST}:{target}"
+                name,
+                callback_data=CallbackData(
+                    COMMAND_GENERAL_RESULT, ACTION_FIRST, target=target
+                ).encode(),
             )
             for name, target in GENERAL
         ]
@@ -127,7 +140,9 @@ def get_general_repeat_markup(target: str) -> InlineKeyboardMarkup:
         [
             InlineKeyboardButton(
                 "Ещё",
-                callback_data=f"{COMMAND_GENERAL_RESULT}:{ACTION_REPEAT}:{target}",
+                callback_data=CallbackData(
+                    COMMAND_GENERAL_RESULT, ACTION_REPEAT, target=target
+                ).encode(),
             )
         ],
     )
@@ -135,27 +150,31 @@ def get_general_repeat_markup(target: str) -> InlineKeyboardMarkup:
 
 def get_custom_single_button_first_markup(
     button_name: str,
-    target: str,
+    id: int,
 ) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup.from_column(
         [
             InlineKeyboardButton(
                 button_name,
-                callback_data=f"{COMMAND_CUSTOM_RESULT_SINGLE}:{MODE_SINGLE}:{ACTION_FIRST}:{target}",
+                callback_data=CallbackData(
+                    COMMAND_CUSTOM_RESULT_SINGLE, ACTION_FIRST, id=id
+                ).encode(),
             )
         ]
     )
 
 
-def get_custom_single_button_repeat_markup(target: str):
+def get_custom_single_button_repeat_markup(id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup.from_column(
         [
             InlineKeyboardButton(
-                "Инфо", callback_data=f"{COMMAND_CUSTOM_INFO}:{target}"
+                "Инфо", callback_data=CallbackData(COMMAND_CUSTOM_INFO, id=id).encode()
             ),
             InlineKeyboardButton(
                 "Ещё",
-                callback_data=f"{COMMAND_CUSTOM_RESULT_SINGLE}:{MODE_SINGLE}:{ACTION_REPEAT}:{target}",
+                callback_data=CallbackData(
+                    COMMAND_CUSTOM_RESULT_SINGLE, ACTION_REPEAT, id=id
+                ).encode(),
             ),
         ],
     )
@@ -163,7 +182,7 @@ def get_custom_single_button_repeat_markup(target: str):
 
 def get_custom_multiple_buttons_first_markup(
     items: List[ButtonsCustomItem],
-    target: str,
+    id: int,
 ) -> InlineKeyboardMarkup:
     rows = []
     row = []
@@ -173,7 +192,12 @@ def get_custom_multiple_buttons_first_markup(
             row.append(
                 InlineKeyboardButton(
                     item.title,
-                    callback_data=f"{COMMAND_CUSTOM_RESULT_MULTI}:{MODE_MULTI}:{ACTION_FIRST}:{target}:{i+1}",
+                    callback_data=CallbackData(
+                        COMMAND_CUSTOM_RESULT_MULTI,
+                        ACTION_FIRST,
+                        id=id,
+                        button_id=i + 1,
+                    ).encode(),
                 )
             )
         else:
@@ -188,26 +212,145 @@ def get_custom_multiple_buttons_first_markup(
 
 
 def get_custom_multiple_buttons_repeat_markup(
-    target: str,
-    button_id: str,
+    id: int,
+    button_id: int,
 ) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup.from_column(
         [
             InlineKeyboardButton(
-                "Инфо", callback_data=f"{COMMAND_CUSTOM_INFO}:{target}"
+                "Инфо", callback_data=CallbackData(COMMAND_CUSTOM_INFO, id=id).encode()
             ),
             InlineKeyboardButton(
                 "Ещё",
-                callback_data=f"{COMMAND_CUSTOM_RESULT_MULTI}:{MODE_MULTI}:{ACTION_REPEAT}:{target}:{button_id}",
+                callback_data=CallbackData(
+                    COMMAND_CUSTOM_RESULT_MULTI,
+                    ACTION_REPEAT,
+                    id=id,
+                    button_id=button_id,
+                ).encode(),
             ),
         ]
     )
 
 
+def get_custom_first_markup(
+    id: int,
+    payload: CustomInfoResponsePayload,
+) -> InlineKeyboardMarkup:
+    buttons = payload.format.get("buttons")  # type: ignore
+    buttons_mode = buttons.get("mode")  # type: ignore
+    if buttons_mode == BUTTONS_MODE_DEFAULT:
+        return get_custom_single_button_first_markup("Сгенерировать", id)
+    elif buttons_mode == BUTTONS_MODE_RENAME:
+        return get_custom_single_button_first_markup(
+            ButtonsRename(buttons).title,  # type: ignore
+            id,
+        )
+    else:  # custom
+        return get_custom_multiple_buttons_first_markup(
+            ButtonsCustom(buttons).items,  # type: ignore
+            id,
+        )
+
+
+class MarkupCache:
+    """
+    Keyboards are immutable, so they are built once and shared.
+    Keyboards of a custom generator are dropped together with its info.
+    """
+
+    general_first: InlineKeyboardMarkup
+    general_repeat: dict[str, InlineKeyboardMarkup]
+
+    def __init__(self, maxsize: int) -> None:
+        self.general_first = get_general_first_markup()
+        self.general_repeat = {
+            target: get_general_repeat_markup(target) for _, target in GENERAL
+        }
+        # id -> keyboards of this generator
+        self._custom: TTLCache[int, dict[tuple, InlineKeyboardMarkup]] = TTLCache(
+            maxsize, math.inf
+        )
+
+    def __len__(self) -> int:
+        return len(self._custom)
+
+    def get_general_repeat(self, target: str) -> InlineKeyboardMarkup:
+        markup = self.general_repeat.get(target)
+        return markup if markup is not None else get_general_repeat_markup(target)
+
+    def get_custom_first(
+        self, id: int, payload: CustomInfoResponsePayload
+    ) -> InlineKeyboardMarkup:
+        return self._get_custom(
+            id, ("first",), lambda: get_custom_first_markup(id, payload)
+        )
+
+    def get_custom_single_repeat(self, id: int) -> InlineKeyboardMarkup:
+        return self._get_custom(
+            id, ("single",), lambda: get_custom_single_button_repeat_markup(id)
+        )
+
+    def get_custom_multi_repeat(self, id: int, button_id: int) -> InlineKeyboardMarkup:
+        return self._get_custom(
+            id,
+            ("multi", button_id),
+            lambda: get_custom_multiple_buttons_repeat_markup(id, button_id),
+        )
+
+    def invalidate(self, id: int) -> None:
+        self._custom.delete(id)
+
+    def _get_custom(
+        self, id: int, key: tuple, build: Callable[[], InlineKeyboardMarkup]
+    ) -> InlineKeyboardMarkup:
+        markups = self._custom.get(id)
+        if markups is None:
+            markups = {}
+            self._custom.set(id, markups)
+
+        markup = markups.get(key)
+        if markup is None:
+            markup = build()
+            markups[key] = markup
+        return markup
+
+
 class Router:
-    def __init__(self, mq: MQ, uuids_map: dict[str, asyncio.Future]):
+    def __init__(
+        self,
+        mq: MQ,
+        requester: Requester,
+        custom_info_cache: TTLCache[int, Response],
+        custom_info_negative_ttl: float,
+        general_prefetcher: GeneralPrefetcher,
+        markups: MarkupCache,
+        admission: AdmissionControl,
+        callback_debounce: float,
+    ):
         self.mq = mq
-        self.uuids_map = uuids_map
+        self.requester = requester
+        self.general_prefetcher = general_prefetcher
+        self.markups = markups
+        self.admission = admission
+        self.custom_info_cache = custom_info_cache
+        self.custom_info_negative_ttl = custom_info_negative_ttl
+        self.custom_info_in_flight: dict[int, asyncio.Future[Response]] = {}
+        self.custom_info_coalesced = 0
+        self.callback_debounce = callback_debounce
+        # (chat id, message id) pressed recently or still being handled
+        self.pressed_messages: TTLCache[tuple[int, int], bool] = TTLCache(
+            PRESSED_MESSAGES_SIZE, math.inf
+        )
+        self.callback_deduped = 0
+        self.callback_handlers: dict[
+            str, Callable[[Update, CallbackData], Awaitable[bool]]
+        ] = {
+            COMMAND_GENERAL_RESULT: self._callback_general_result,
+            COMMAND_CUSTOM_INFO: self._callback_custom_info,
+            COMMAND_CUSTOM_RESULT_SINGLE: self._callback_custom_result,
+            COMMAND_CUSTOM_RESULT_MULTI: self._callback_custom_result,
+        }
 
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await update.message.reply_text(HELP_MESSAGE, parse_mode=ParseMode.MARKDOWN_V2)  # type: ignore
@@ -216,7 +359,7 @@ class Router:
         log_event(Event(Action.HELP, user_id))
 
     async def general(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-        await update.message.reply_text("Выберите:", reply_markup=get_general_first_markup())  # type: ignore
+        await update.message.reply_text("Выберите:", reply_markup=self.markups.general_first)  # type: ignore
 
         user_id = update.effective_user.id if update.effective_user is not None else 0
         log_event(Event(Action.GENERAL_INFO, user_id))
@@ -241,33 +384,13 @@ class Router:
             await update.message.reply_text(ID_MUST_BE_A_NUMBER_MESSAGE)  # type: ignore
             return
 
-        uuid, response_future = self._create_response_future()
-
-        await self.mq.custom_info(uuid, id)
-
+        user_id = update.effective_user.id if update.effective_user is not None else 0
         try:
-            response = await asyncio.wait_for(response_future, timeout=TIMEOUT)
+            response = await self._custom_info(id, user_id)
             if response.status == RESPONSE_STATUS_OK:
                 assert response.payload is not None
                 payload = CustomInfoResponsePayload(response.payload)
-                buttons = payload.format.get("buttons")  # type: ignore
-                buttons_mode = buttons.get("mode")  # type: ignore
-
-                if buttons_mode == BUTTONS_MODE_DEFAULT:
-                    markup = get_custom_single_button_first_markup(
-                        "Сгенерировать", str(id)
-                    )
-                elif buttons_mode == BUTTONS_MODE_RENAME:
-                    markup = get_custom_single_button_first_markup(
-                        ButtonsRename(buttons).title,  # type: ignore
-                        str(id),
-                    )
-                else:  # custom
-                    markup = get_custom_multiple_buttons_first_markup(
-                        ButtonsCustom(buttons).items,  # type: ignore
-                        str(id),
-                    )
-
+                markup = self.markups.get_custom_first(id, payload)
                 text = f"*{escape_text(payload.title)}*\n{escape_text(payload.description)}"
                 await update.message.reply_text(  # type: ignore
                     text,
@@ -275,9 +398,6 @@ class Router:
                     parse_mode=ParseMode.MARKDOWN_V2,
                 )
 
-                user_id = (
-                    update.effective_user.id if update.effective_user is not None else 0
-                )
                 log_event(Event(Action.CUSTOM_INFO, user_id, {"id": id}))
 
             elif response.status == RESPONSE_STATUS_FORBIDDEN:
@@ -286,217 +406,278 @@ class Router:
                 await update.message.reply_text(GENERATOR_NOT_FOUND_MESSAGE)  # type: ignore
             else:
                 await update.message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-        except asyncio.exceptions.TimeoutError:
+        except BusyError:
+            await update.message.reply_text(BUSY_MESSAGE)  # type: ignore
+        except REQUEST_ERRORS:
             await update.message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-        finally:
-            self._delete_response_future(uuid)
 
     async def callback(
         self,
         update: Update,
         context: ContextTypes.DEFAULT_TYPE,
     ) -> None:
+        """
+        Answering the query, the MQ round trip and removing the keyboard of the
+        pressed message do not depend on each other and run concurrently.
+        Handlers return whether the result was sent, otherwise the removed
+        keyboard is put back so the button can be pressed again.
+        Presses of a message while its previous press is handled, or within
+        `callback_debounce` after, are only answered.
+        """
         query = update.callback_query
-        await query.answer()  # type: ignore
-
-        is_general_result = query.data.startswith("general_result")  # type: ignore
-        is_custom_info = query.data.startswith("custom_info")  # type: ignore
-        is_custom_result = query.data.startswith("custom_result")  # type: ignore
+        message = update.effective_message
+        answer = asyncio.ensure_future(self._answer_query(update))
 
-        if is_general_result:
-            _, action, name = query.data.split(":", 2)  # type: ignore
+        key = (message.chat_id, message.message_id)  # type: ignore
+        if self.pressed_messages.get(key) is not None:
+            self.callback_deduped += 1
+            await answer
+            return
+        self.pressed_messages.set(key, True)
 
-            uuid, response_future = self._create_response_future()
+        try:
+            try:
+                data = CallbackData.decode(query.data or "")  # type: ignore
+            except InvalidIdError:
+                await message.reply_text(ID_MUST_BE_A_NUMBER_MESSAGE)  # type: ignore
+                return
+            except ValueError:
+                # Not a button of this bot, the query is only answered
+                return
 
-            await self.mq.general_result(uuid, name)
+            removal = None
+            if data.action == ACTION_REPEAT or data.command == COMMAND_CUSTOM_INFO:
+                # Repeat and info keep the pressed message and send a new one
+                removal = asyncio.ensure_future(self._edit_reply_markup(message))  # type: ignore
 
+            sent = False
             try:
-                response = await asyncio.wait_for(response_future, timeout=TIMEOUT)
-                if response.status == RESPONSE_STATUS_OK:
-                    assert response.payload is not None
-                    payload = GenerateResponsePayload(response.payload)
-                    if name == "superpowers":
-                        title, description = payload.result.split(";", 1)
-                        text = f"*{escape_text(title)}*\n{escape_text(description)}"
-                    else:
-                        text = escape_text(payload.result)
-
-                    if action == ACTION_REPEAT:
-                        await update.effective_message.edit_reply_markup()  # type: ignore
-                        await update.effective_message.reply_text(  # type: ignore
-                            text,
-                            reply_markup=get_general_repeat_markup(name),
-                            parse_mode=ParseMode.MARKDOWN_V2,
-                        )
-                    else:
-                        await update.effective_message.edit_text(  # type: ignore
-                            text,
-                            reply_markup=get_general_repeat_markup(name),
-                            parse_mode=ParseMode.MARKDOWN_V2,
-                        )
-
-                    user_id = (
-                        update.effective_user.id
-                        if update.effective_user is not None
-                        else 0
-                    )
-                    log_event(Event(Action.GENERAL_RESULT, user_id, {"name": name}))
+                sent = await self.callback_handlers[data.command](update, data)
+            finally:
+                if removal is not None:
+                    removed = await removal
+                    if removed and not sent:
+                        await self._edit_reply_markup(message, message.reply_markup)  # type: ignore
+        finally:
+            if self.callback_debounce > 0:
+                self.pressed_messages.set(key, True, ttl=self.callback_debounce)
+            else:
+                self.pressed_messages.delete(key)
+            await answer
 
-                elif response.status == RESPONSE_STATUS_NOT_FOUND:
-                    await update.effective_message.reply_text(  # type: ignore
-                        GENERATOR_NOT_FOUND_MESSAGE
-                    )
+    async def _answer_query(self, update: Update) -> None:
+        try:
+            await update.callback_query.answer()  # type: ignore
+        except TelegramError as e:
+            # Only the loading indicator is left on the button
+            logger.warning("Failed to answer callback query: %r", e)
+
+    async def _edit_reply_markup(
+        self, message: Message, markup: Optional[InlineKeyboardMarkup] = None
+    ) -> bool:
+        try:
+            await message.edit_reply_markup(markup)
+        except TelegramError as e:
+            logger.warning("Failed to edit reply markup: %r", e)
+            return False
+        return True
+
+    async def _callback_general_result(
+        self, update: Update, data: CallbackData
+    ) -> bool:
+        name = data.target
+        assert name is not None
+
+        user_id = update.effective_user.id if update.effective_user is not None else 0
+        try:
+            response = await self._general_result(name, user_id)
+            if response.status == RESPONSE_STATUS_OK:
+                assert response.payload is not None
+                payload = GenerateResponsePayload(response.payload)
+                if name == "superpowers":
+                    title, description = payload.result.split(";", 1)
+                    text = f"*{escape_text(title)}*\n{escape_text(description)}"
                 else:
-                    await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+                    text = escape_text(payload.result)
+
+                await self._reply_result(
+                    update, data, text, self.markups.get_general_repeat(name)
+                )
 
-            except asyncio.exceptions.TimeoutError:
+                log_event(Event(Action.GENERAL_RESULT, user_id, {"name": name}))
+                return True
+
+            elif response.status == RESPONSE_STATUS_NOT_FOUND:
+                await update.effective_message.reply_text(GENERATOR_NOT_FOUND_MESSAGE)  # type: ignore
+            else:
                 await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-            finally:
-                self._delete_response_future(uuid)
 
-        elif is_custom_info:
-            _, id = query.data.split(":", 1)  # type: ignore
+        except BusyError:
+            await update.effective_message.reply_text(BUSY_MESSAGE)  # type: ignore
+        except REQUEST_ERRORS:
+            await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+        return False
 
-            try:
-                id = int(id)
-            except ValueError:
-                await update.effective_message.reply_text(ID_MUST_BE_A_NUMBER_MESSAGE)  # type: ignore
-                return
+    async def _callback_custom_info(self, update: Update, data: CallbackData) -> bool:
+        id = data.id
+        assert id is not None
+
+        user_id = update.effective_user.id if update.effective_user is not None else 0
+        try:
+            response = await self._custom_info(id, user_id)
+            if response.status == RESPONSE_STATUS_OK:
+                assert response.payload is not None
+                payload = CustomInfoResponsePayload(response.payload)
+                text = f"*{escape_text(payload.title)}*\n{escape_text(payload.description)}"
+                markup = self.markups.get_custom_first(id, payload)
+                await update.effective_message.reply_text(  # type: ignore
+                    text,
+                    reply_markup=markup,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                )
+
+                log_event(Event(Action.CUSTOM_INFO, user_id, {"id": id}))
+                return True
 
-            uuid, response_future = self._create_response_future()
+            elif response.status == RESPONSE_STATUS_FORBIDDEN:
+                await update.effective_message.reply_text(FORBIDDEN_MESSAGE)  # type: ignore
+            elif response.status == RESPONSE_STATUS_NOT_FOUND:
+                await update.effective_message.reply_text(GENERATOR_NOT_FOUND_MESSAGE)  # type: ignore
+            else:
+                await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+        except BusyError:
+            await update.effective_message.reply_text(BUSY_MESSAGE)  # type: ignore
+        except REQUEST_ERRORS:
+            await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+        return False
 
-            await self.mq.custom_info(uuid, id)
+    async def _callback_custom_result(self, update: Update, data: CallbackData) -> bool:
+        id, button_id = data.id, data.button_id
+        assert id is not None
 
-            try:
-                response = await asyncio.wait_for(response_future, timeout=TIMEOUT)
-                if response.status == RESPONSE_STATUS_OK:
-                    assert response.payload is not None
-                    payload = CustomInfoResponsePayload(response.payload)
-                    text = f"*{payload.title}*\n{escape_text(payload.description)}"
-                    buttons = payload.format.get("buttons")  # type: ignore
-                    buttons_mode = buttons.get("mode")  # type: ignore
-                    if buttons_mode == BUTTONS_MODE_DEFAULT:
-                        markup = get_custom_single_button_first_markup(
-                            "Сгенерировать", str(id)
-                        )
-                    elif buttons_mode == BUTTONS_MODE_RENAME:
-                        markup = get_custom_single_button_first_markup(
-                            ButtonsRename(buttons).title,  # type: ignore
-                            str(id),
-                        )
-                    else:  # custom
-                        markup = get_custom_multiple_buttons_first_markup(
-                            ButtonsCustom(buttons).items,  # type: ignore
-                            str(id),
-                        )
-                    await update.effective_message.edit_reply_markup()  # type: ignore
-                    await update.effective_message.reply_text(  # type: ignore
-                        text,
-                        reply_markup=markup,
-                        parse_mode=ParseMode.MARKDOWN_V2,
+        user_id = update.effective_user.id if update.effective_user is not None else 0
+        try:
+            with self.admission.admit(user_id):
+                if button_id is None:
+                    response = await self.requester.request(
+                        COMMAND_CUSTOM_RESULT_SINGLE,
+                        id,
+                        lambda uuid: self.mq.custom_result(uuid, id),
                     )
-
-                    user_id = (
-                        update.effective_user.id
-                        if update.effective_user is not None
-                        else 0
+                else:
+                    response = await self.requester.request(
+                        COMMAND_CUSTOM_RESULT_MULTI,
+                        (id, button_id),
+                        lambda uuid: self.mq.custom_result_with_button_id(
+                            uuid, id, button_id
+                        ),
                     )
-                    log_event(Event(Action.CUSTOM_INFO, user_id, {"id": id}))
 
-                elif response.status == RESPONSE_STATUS_FORBIDDEN:
-                    await update.effective_message.reply_text(FORBIDDEN_MESSAGE)  # type: ignore
-                elif response.status == RESPONSE_STATUS_NOT_FOUND:
-                    await update.effective_message.reply_text(  # type: ignore
-                        GENERATOR_NOT_FOUND_MESSAGE
-                    )
+            if response.status == RESPONSE_STATUS_OK:
+                assert response.payload is not None
+                payload = GenerateResponsePayload(response.payload)
+                if button_id is None:
+                    markup = self.markups.get_custom_single_repeat(id)
                 else:
-                    await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-            except asyncio.exceptions.TimeoutError:
-                await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-            finally:
-                self._delete_response_future(uuid)
+                    markup = self.markups.get_custom_multi_repeat(id, button_id)
+
+                await self._reply_result(
+                    update, data, escape_text(payload.result), markup
+                )
 
-        elif is_custom_result:
-            _, mode, action, rest = query.data.split(":", 3)  # type: ignore
+                log_event(Event(Action.CUSTOM_RESULT, user_id, {"id": id}))
+                return True
 
-            if mode == MODE_SINGLE:
-                id = rest
-                button_id = None
+            elif response.status == RESPONSE_STATUS_FORBIDDEN:
+                await update.effective_message.reply_text(FORBIDDEN_MESSAGE)  # type: ignore
+            elif response.status == RESPONSE_STATUS_NOT_FOUND:
+                await update.effective_message.reply_text(GENERATOR_NOT_FOUND_MESSAGE)  # type: ignore
             else:
-                id, button_id = rest.split(":", 1)
-                button_id = int(button_id)
+                await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+        except BusyError:
+            await update.effective_message.reply_text(BUSY_MESSAGE)  # type: ignore
+        except REQUEST_ERRORS:
+            await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
+        return False
 
-            try:
-                id = int(id)
-            except ValueError:
-                await update.effective_message.reply_text(ID_MUST_BE_A_NUMBER_MESSAGE)  # type: ignore
-                return
+    async def _reply_result(
+        self,
+        update: Update,
+        data: CallbackData,
+        text: str,
+        markup: InlineKeyboardMarkup,
+    ) -> None:
+        """
+        Repeat keeps the previous result and sends a new message,
+        `callback` removes the keyboard of the previous one
+        """
+        if data.action == ACTION_REPEAT:
+            await update.effective_message.reply_text(  # type: ignore
+                text,
+                reply_markup=markup,
+                parse_mode=ParseMode.MARKDOWN_V2,
+            )
+        else:
+            await update.effective_message.edit_text(  # type: ignore
+                text,
+                reply_markup=markup,
+                parse_mode=ParseMode.MARKDOWN_V2,
+            )
 
-            uuid, response_future = self._create_response_future()
+    async def _general_result(self, name: str, user_id: int) -> Response:
+        """
+        Prefetched or live general_result round trip,
+        raises BusyError or REQUEST_ERRORS
+        """
+        response = self.general_prefetcher.take(name)
+        if response is not None:
+            return response
+
+        with self.admission.admit(user_id):
+            return await self.requester.request(
+                COMMAND_GENERAL_RESULT,
+                name,
+                lambda uuid: self.mq.general_result(uuid, name),
+            )
 
-            if mode == MODE_SINGLE:
-                await self.mq.custom_result(uuid, id)
-            else:
-                assert button_id is not None
-                await self.mq.custom_result_with_button_id(uuid, id, button_id)
+    async def _custom_info(self, id: int, user_id: int) -> Response:
+        """
+        Cached custom_info round trip, raises BusyError or REQUEST_ERRORS.
+        Concurrent callers for the same id share one request, it is admitted
+        for the first one.
+        """
+        response = self.custom_info_cache.get(id)
+        if response is not None:
+            return response
+
+        task = self.custom_info_in_flight.get(id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_custom_info(id, user_id))
+            self.custom_info_in_flight[id] = task
+            task.add_done_callback(lambda t: self._on_custom_info_done(id, t))
+        else:
+            self.custom_info_coalesced += 1
 
-            try:
-                response = await asyncio.wait_for(response_future, timeout=TIMEOUT)
-                if response.status == RESPONSE_STATUS_OK:
-                    assert response.payload is not None
-                    payload = GenerateResponsePayload(response.payload)
-                    if mode == MODE_SINGLE:
-                        markup = get_custom_single_button_repeat_markup(str(id))
-                    else:  # multi
-                        assert button_id is not None
-                        markup = get_custom_multiple_buttons_repeat_markup(
-                            str(id), str(button_id)
-                        )
-                    text = escape_text(payload.result)
-                    if action == ACTION_REPEAT:
-                        await update.effective_message.edit_reply_markup()  # type: ignore
-                        await update.effective_message.reply_text(  # type: ignore
-                            text,
-                            reply_markup=markup,
-                            parse_mode=ParseMode.MARKDOWN_V2,
-                        )
-                    else:
-                        await update.effective_message.edit_text(  # type: ignore
-                            text,
-                            reply_markup=markup,
-                            parse_mode=ParseMode.MARKDOWN_V2,
-                        )
-
-                    user_id = (
-                        update.effective_user.id
-                        if update.effective_user is not None
-                        else 0
-                    )
-                    log_event(Event(Action.CUSTOM_RESULT, user_id, {"id": id}))
+        # Cancelled caller must not cancel the request for the others
+        return await asyncio.shield(task)
 
-                elif response.status == RESPONSE_STATUS_FORBIDDEN:
-                    await update.effective_message.reply_text(FORBIDDEN_MESSAGE)  # type: ignore
-                elif response.status == RESPONSE_STATUS_NOT_FOUND:
-                    await update.effective_message.reply_text(  # type: ignore
-                        GENERATOR_NOT_FOUND_MESSAGE
-                    )
-                else:
-                    await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-            except asyncio.exceptions.TimeoutError:
-                await update.effective_message.reply_text(SERVER_ERROR_MESSAGE)  # type: ignore
-            finally:
-                self._delete_response_future(uuid)
+    async def _fetch_custom_info(self, id: int, user_id: int) -> Response:
+        with self.admission.admit(user_id):
+            response = await self.requester.request(
+                COMMAND_CUSTOM_INFO, id, lambda uuid: self.mq.custom_info(uuid, id)
+            )
 
-    def _create_response_future(self) -> tuple[str, asyncio.Future[Response]]:
-        """Return uuid and future"""
-        uuid = str(uuid4())
-        response_future: asyncio.Future[Response] = asyncio.Future()
-        self.uuids_map.update({uuid: response_future})
-        return uuid, response_future
+        # Fresh info may have other buttons
+        self.markups.invalidate(id)
+        if response.status == RESPONSE_STATUS_OK:
+            self.custom_info_cache.set(id, response)
+        elif response.status in (RESPONSE_STATUS_FORBIDDEN, RESPONSE_STATUS_NOT_FOUND):
+            self.custom_info_cache.set(id, response, ttl=self.custom_info_negative_ttl)
 
-    def _delete_response_future(self, uuid: str) -> None:
-        """Delete future from map if it exists"""
-        try:
-            self.uuids_map.pop(uuid)
-        except KeyError:
-            pass
+        return response
+
+    def _on_custom_info_done(self, id: int, task: asyncio.Future[Response]) -> None:
+        self.custom_info_in_flight.pop(id, None)
+        if not task.cancelled():
+            # Mark as retrieved in case every waiter is gone
+            task.exception()
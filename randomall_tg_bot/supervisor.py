@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import random
+
+from randomall_tg_bot.mq import MQ
+
+logger = logging.getLogger(__name__)
+
+
+class MQSupervisor:
+    """
+    Keeps MQ connected: consumes replies and publishes requests while the
+    connection is up, and connects again with exponential backoff when it is
+    lost or cannot be established. Requests waiting for the lost connection
+    fail right away, new ones are rejected until it is back.
+    """
+
+    mq: MQ
+    min_delay: float
+    max_delay: float
+
+    reconnects: int
+
+    def __init__(self, mq: MQ, min_delay: float, max_delay: float) -> None:
+        self.mq = mq
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.reconnects = 0
+
+    async def run(self) -> None:
+        delay = self.min_delay
+        while True:
+            try:
+                await self.mq.connect()
+            except Exception as e:
+                logger.warning("Failed to connect to RabbitMQ: %r", e)
+            else:
+                logger.info("Connected to RabbitMQ")
+                delay = self.min_delay
+                try:
+                    await self._serve()
+                except Exception as e:
+                    logger.warning("Lost connection to RabbitMQ: %r", e)
+                else:
+                    logger.warning("Lost connection to RabbitMQ")
+                finally:
+                    self.mq.disconnected()
+                    await self._close()
+
+            # Jitter keeps workers from reconnecting in lockstep
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_delay)
+            self.reconnects += 1
+
+    async def drain(self, grace_period: float) -> None:
+        """
+        Keep publishing requests and consuming replies until every request in
+        flight is answered or expired, for at most `grace_period`
+        """
+        pending = self.mq.pending
+        if len(pending) == 0 or not self.mq.connected:
+            return
+
+        logger.info("Waiting for %s requests in flight", len(pending))
+        if not await pending.join(grace_period):
+            logger.warning("Dropping %s requests in flight", len(pending))
+
+    async def _serve(self) -> None:
+        """Return when the connection is closed, raise if a task fails"""
+        recv_task = asyncio.create_task(self.mq.recv())
+        publisher_task = asyncio.create_task(self.mq.publisher.run())
+        try:
+            done, _ = await asyncio.wait(
+                [recv_task, publisher_task], return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            recv_task.cancel()
+            publisher_task.cancel()
+
+        for task in done:
+            task.result()
+
+    async def _close(self) -> None:
+        try:
+            await self.mq.close()
+        except Exception as e:
+            logger.debug("Failed to close connection: %r", e)
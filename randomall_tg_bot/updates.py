@@ -0,0 +1,55 @@
+import logging
+from collections import deque
+from typing import Any, Awaitable
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Updates of different chats are handled concurrently, updates of one chat
+    one after another in the order they were received. An update of a chat
+    that is busy is queued behind it and its slot is released, so a chat
+    holds at most one of `max_concurrent_updates` slots.
+    """
+
+    __slots__ = ("_chats",)
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        # chat id -> updates waiting for the one being handled
+        self._chats: dict[int, deque[Awaitable[Any]]] = {}
+
+    async def do_process_update(
+        self, update: object, coroutine: Awaitable[Any]
+    ) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+
+        waiting = self._chats.get(chat.id)
+        if waiting is not None:
+            waiting.append(coroutine)
+            return
+
+        waiting = deque([coroutine])
+        self._chats[chat.id] = waiting
+        try:
+            while len(waiting) > 0:
+                try:
+                    await waiting.popleft()
+                except Exception:
+                    # Handler errors are handled by the application already
+                    logger.exception("Update of chat %s failed", chat.id)
+        finally:
+            del self._chats[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,148 @@
+"""
+Sharded mode: the front process receives updates and hands them to worker
+processes by chat id, so updates of one chat are always handled in order by
+the same worker. Every worker has its own router and MQ connection.
+A worker that exits is started again on the same queue.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import signal
+from contextlib import suppress
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+
+from randomall_tg_bot.app import create_application, run_application
+from randomall_tg_bot.config import (
+    DEBUG,
+    METRICS_PORT,
+    MQ_RPC,
+    SHUTDOWN_GRACE_PERIOD,
+    TELEGRAM_API_TOKEN,
+    TELEGRAM_API_URL,
+)
+from randomall_tg_bot.logger import event_log_path, event_writer
+
+# Worker handles its queued updates, then waits for replies in flight
+SHUTDOWN_TIMEOUT = 30.0 + SHUTDOWN_GRACE_PERIOD
+# Seconds between checks that workers are alive
+MONITOR_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+def shard(chat_id: int, workers: int) -> int:
+    return chat_id % workers
+
+
+def run_sharded(workers: int) -> None:
+    if not MQ_RPC:
+        logger.warning(
+            "Workers share the reply queue without MQ_RPC=1, "
+            "replies delivered to another worker than the sender are lost"
+        )
+
+    ctx = multiprocessing.get_context("spawn")
+    queues: list[Queue] = [ctx.Queue() for _ in range(workers)]
+
+    def start_worker(index: int) -> BaseProcess:
+        process = ctx.Process(
+            target=run_worker, args=(index, queues[index]), name=f"worker-{index}"
+        )
+        process.start()
+        return process
+
+    processes = [start_worker(i) for i in range(workers)]
+    monitor_task: Optional[asyncio.Task] = None
+
+    async def monitor() -> None:
+        """Updates queued for a dead worker are handled by its replacement"""
+        while True:
+            await asyncio.sleep(MONITOR_INTERVAL)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.error(
+                        "%s exited with code %s, starting it again",
+                        process.name,
+                        process.exitcode,
+                    )
+                    processes[i] = start_worker(i)
+
+    async def forward(update: Update, _: ContextTypes.DEFAULT_TYPE) -> None:
+        chat_id = update.effective_chat.id if update.effective_chat is not None else 0
+        queues[shard(chat_id, workers)].put(update.to_dict())
+
+    async def on_startup(_: Application) -> None:
+        nonlocal monitor_task
+        monitor_task = asyncio.create_task(monitor())
+
+    async def stop_worker(process: BaseProcess) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, process.join, SHUTDOWN_TIMEOUT)
+        if process.is_alive():
+            logger.warning("%s did not stop in time", process.name)
+            process.terminate()
+
+    async def on_shutdown(_: Application) -> None:
+        if monitor_task is not None:
+            monitor_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await monitor_task
+
+        for queue in queues:
+            queue.put(None)
+        # Workers finish their updates at the same time
+        await asyncio.gather(*(stop_worker(process) for process in processes))
+
+    app = (
+        Application.builder()
+        .token(TELEGRAM_API_TOKEN)
+        .base_url(TELEGRAM_API_URL)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, forward))
+
+    run_application(app)
+
+
+def run_worker(index: int, queue: Queue) -> None:
+    # Front process stops the worker with None, so it can finish its updates
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    level = logging.DEBUG if DEBUG else logging.INFO
+    logging.basicConfig(level=level)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    event_writer.path = event_log_path(index)
+    metrics_port = METRICS_PORT + index if METRICS_PORT else 0
+    app = create_application(loop, updater=False, metrics_port=metrics_port)
+    loop.run_until_complete(_serve(app, queue))
+
+
+async def _serve(app: Application, queue: Queue) -> None:
+    loop = asyncio.get_running_loop()
+
+    await app.initialize()
+    await app.start()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+    finally:
+        # Updates already in the queue are processed before stop returns
+        await app.stop()
+        await app.shutdown()
+        if app.post_shutdown is not None:
+            await app.post_shutdown(app)
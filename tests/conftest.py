@@ -0,0 +1,6 @@
+import os
+
+from randomall_tg_bot.logger import event_writer
+
+# Actions of tests are not worth keeping
+event_writer.path = os.devnull
@@ -0,0 +1,600 @@
+"""In-process stand-ins for Telegram, the generator backend and RabbitMQ"""
+
+import asyncio
+import itertools
+import random
+from collections import Counter
+from typing import Optional
+
+import orjson
+from pamqp import commands, frame
+from pamqp.body import ContentBody
+from pamqp.exceptions import UnmarshalingException
+from pamqp.header import ContentHeader, ProtocolHeader
+from telegram import Bot, Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+from randomall_tg_bot.app import add_handlers, application_builder, create_router
+from randomall_tg_bot.messages import (
+    BUTTONS_MODE_DEFAULT,
+    COMMAND_CUSTOM_INFO,
+    COMMAND_CUSTOM_RESULT_MULTI,
+    COMMAND_CUSTOM_RESULT_SINGLE,
+    COMMAND_GENERAL_RESULT,
+    COMMAND_GENERAL_RESULT_BATCH,
+    RESPONSE_STATUS_NOT_FOUND,
+    RESPONSE_STATUS_NOT_IMPLEMENTED,
+    RESPONSE_STATUS_OK,
+    Request,
+    Response,
+)
+from randomall_tg_bot.mq import MQ
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.ratelimit import SendScheduler
+from randomall_tg_bot.router import Router
+
+
+class FakeResponder:
+    """
+    Answers requests the way the generator backend does.
+    `slow_share` of replies take `slow_latency` instead of `latency`.
+    """
+
+    latency: float
+    custom_infos: dict[int, dict]
+    batch: bool
+    slow_share: float
+    slow_latency: float
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        custom_infos: Optional[dict[int, dict]] = None,
+        batch: bool = True,
+        slow_share: float = 0.0,
+        slow_latency: float = 0.0,
+    ) -> None:
+        self.latency = latency
+        self.custom_infos = custom_infos if custom_infos is not None else {}
+        self.batch = batch
+        self.slow_share = slow_share
+        self.slow_latency = slow_latency
+        self.requests: list[Request] = []
+        self._counter = itertools.count(1)
+
+    def handle(self, request: Request) -> Response:
+        self.requests.append(request)
+        command = request.command
+        payload = request.payload
+
+        if command == COMMAND_GENERAL_RESULT:
+            return self._ok(request, {"msg": self._result(payload["name"])})
+
+        if command == COMMAND_GENERAL_RESULT_BATCH:
+            if not self.batch:
+                return Response(
+                    request.uuid, command, RESPONSE_STATUS_NOT_IMPLEMENTED, None
+                )
+            msgs = [self._result(payload["name"]) for _ in range(payload["count"])]
+            return self._ok(request, {"msgs": msgs})
+
+        if command == COMMAND_CUSTOM_INFO:
+            info = self.custom_infos.get(payload["id"])
+            if info is None:
+                return Response(request.uuid, command, RESPONSE_STATUS_NOT_FOUND, None)
+            return self._ok(request, info)
+
+        if command in (COMMAND_CUSTOM_RESULT_SINGLE, COMMAND_CUSTOM_RESULT_MULTI):
+            if payload["id"] not in self.custom_infos:
+                return Response(request.uuid, command, RESPONSE_STATUS_NOT_FOUND, None)
+            return self._ok(request, {"msg": self._result(str(payload["id"]))})
+
+        return Response(request.uuid, command, RESPONSE_STATUS_NOT_IMPLEMENTED, None)
+
+    def delay(self) -> float:
+        """Seconds before the next reply"""
+        if self.slow_share > 0 and random.random() < self.slow_share:
+            return self.slow_latency
+        return self.latency
+
+    def _ok(self, request: Request, payload: dict) -> Response:
+        return Response(request.uuid, request.command, RESPONSE_STATUS_OK, payload)
+
+    def _result(self, name: str) -> str:
+        result = f"{name} #{next(self._counter)}"
+        if name == "superpowers":
+            # Backend sends title and description separated with ";"
+            result += ";Description."
+        return result
+
+
+def custom_info(
+    id: int,
+    mode: str = BUTTONS_MODE_DEFAULT,
+    buttons: Optional[dict] = None,
+) -> dict:
+    """Build custom_info payload for `FakeResponder.custom_infos`"""
+    return {
+        "id": id,
+        "title": f"Generator {id}",
+        "description": "Description.",
+        "format": {"buttons": {"mode": mode, **(buttons or {})}},
+    }
+
+
+class FakeMQ(MQ):
+    """MQ that resolves requests with a `FakeResponder` instead of a broker"""
+
+    def __init__(
+        self,
+        responder: FakeResponder,
+        pending: PendingRequests,
+    ) -> None:
+        super().__init__("", pending)
+        self.responder = responder
+
+    @property
+    def connected(self) -> bool:
+        return True
+
+    async def connect(self) -> None:
+        pass
+
+    @property
+    def reply_to(self) -> str:
+        return "fake"
+
+    async def recv(self) -> None:
+        await asyncio.Future()
+
+    async def close(self) -> None:
+        pass
+
+    async def _make_request(self, request: Request) -> None:
+        response = self.responder.handle(request)
+        loop = asyncio.get_running_loop()
+        delay = self.responder.delay()
+        if delay > 0:
+            loop.call_later(delay, self._reply, response)
+        else:
+            loop.call_soon(self._reply, response)
+
+    def _reply(self, response: Response) -> None:
+        self.pending.resolve(response.uuid, response)
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    Bot API transport that answers every call locally after `latency`.
+    Calls are kept in `sent` as (method, parameters) in order of arrival.
+    """
+
+    latency: float
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.sent: list[tuple[str, dict]] = []
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data: Optional[RequestData] = None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        parameters = request_data.parameters if request_data is not None else {}
+        self.sent.append((endpoint, parameters))
+        if endpoint == "getMe":
+            result: object = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "Fake",
+                "username": "fake_bot",
+            }
+        elif endpoint in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            chat_id = parameters.get("chat_id", 1)
+            result = {
+                "message_id": parameters.get("message_id", next(self._message_ids)),
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "text": parameters.get("text", ""),
+            }
+        else:
+            result = True
+
+        return 200, orjson.dumps({"ok": True, "result": result})
+
+
+def fake_update(
+    bot: Bot,
+    update_id: int,
+    chat_id: int,
+    text: Optional[str] = None,
+    data: Optional[str] = None,
+    message_id: Optional[int] = None,
+) -> Update:
+    """
+    Private chat message with `text`, or press of a button with callback
+    `data` on message `message_id`
+    """
+    user = {"id": chat_id, "is_bot": False, "first_name": "Fake"}
+    message = {
+        "message_id": message_id if message_id is not None else update_id,
+        "date": 0,
+        "chat": {"id": chat_id, "type": "private"},
+        "from": user,
+    }
+    if data is not None:
+        payload = {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "message": {**message, "text": "..."},
+                "data": data,
+            },
+        }
+    else:
+        message["text"] = text
+        if text is not None and text.startswith("/"):
+            command = {
+                "type": "bot_command",
+                "offset": 0,
+                "length": len(text.split()[0]),
+            }
+            message["entities"] = [command]
+        payload = {"update_id": update_id, "message": message}
+
+    return Update.de_json(payload, bot)  # type: ignore
+
+
+def fake_application(
+    router: Router,
+    telegram_request: FakeTelegramRequest,
+    send_scheduler: SendScheduler,
+    updater: bool = False,
+) -> Application:
+    """
+    Application built like the bot's one, updates are put into its queue and
+    Bot API calls are answered by `telegram_request`
+    """
+    builder = (
+        application_builder(send_scheduler).token("1:fake").request(telegram_request)
+    )
+    if not updater:
+        builder = builder.updater(None)
+    app = builder.build()
+    add_handlers(app, router)
+    return app
+
+
+async def process_updates(app: Application, updates: list[Update]) -> None:
+    """
+    Put `updates` into the queue of `app` and wait until they are handled,
+    they have to be made with `app.bot` for replies to be sent
+    """
+    await app.initialize()
+    await app.start()
+    for update in updates:
+        await app.update_queue.put(update)
+    await app.update_queue.join()
+    await app.stop()
+    await app.shutdown()
+
+
+class FakeBot:
+    """
+    Router and application of the bot with Telegram and the generator backend
+    replaced: replies come from `responder`, Bot API calls are recorded by
+    `telegram_request` and are not rate limited.
+    """
+
+    def __init__(self, responder: FakeResponder, updater: bool = False) -> None:
+        self.responder = responder
+        pending = PendingRequests()
+        self.router = create_router(FakeMQ(responder, pending), pending)
+        self.telegram_request = FakeTelegramRequest()
+        self.app = fake_application(
+            self.router,
+            self.telegram_request,
+            SendScheduler(1000, 1000, 1000, 0),
+            updater,
+        )
+        self._update_ids = itertools.count(1)
+
+    def update(
+        self,
+        chat_id: int,
+        text: Optional[str] = None,
+        data: Optional[str] = None,
+        message_id: Optional[int] = None,
+    ) -> Update:
+        return fake_update(
+            self.app.bot, next(self._update_ids), chat_id, text, data, message_id
+        )
+
+    def run(self, updates: list[Update]) -> None:
+        """Handle `updates` through the application in a new event loop"""
+        asyncio.run(process_updates(self.app, updates))
+
+    def messages(self) -> list[tuple[int, str]]:
+        """Chat id and text of every message sent, in order"""
+        return [
+            (parameters["chat_id"], parameters["text"])
+            for endpoint, parameters in self.telegram_request.sent
+            if endpoint == "sendMessage"
+        ]
+
+
+class FakeBroker:
+    """
+    Just enough of an AMQP 0-9-1 server for `MQ`, on a local port.
+    Requests published to the request queue are answered by `responder` into
+    their `reply_to` queue. `kill` drops every connection like a crashed
+    broker, while `refuse` is set new connections are closed right away,
+    `close_channel` closes a single channel.
+    Publishes of a channel are handled one by one, `channel_latency` each,
+    like RabbitMQ channel processes do.
+    """
+
+    host: str
+    port: int
+    responder: FakeResponder
+    channel_latency: float
+    refuse: bool
+
+    published: int
+
+    def __init__(
+        self,
+        responder: FakeResponder,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        channel_latency: float = 0.0,
+    ) -> None:
+        self.responder = responder
+        self.host = host
+        self.port = port
+        self.channel_latency = channel_latency
+        self.refuse = False
+        self.published = 0
+
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        # queue name -> writer, channel, consumer tag
+        self._consumers: dict[str, tuple[asyncio.StreamWriter, int, str]] = {}
+        self._delivery_tags: dict[tuple[asyncio.StreamWriter, int], int] = {}
+        # writer, channel -> loop time the channel is done with its publishes
+        self._channel_ready: dict[tuple[asyncio.StreamWriter, int], float] = {}
+        self._queue_names = itertools.count(1)
+
+    @property
+    def url(self) -> str:
+        return f"amqp://guest:guest@{self.host}:{self.port}/"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    def kill(self) -> None:
+        for writer in list(self._writers):
+            writer.transport.abort()  # type: ignore
+        self._writers.clear()
+        self._consumers.clear()
+        self._delivery_tags.clear()
+        self._channel_ready.clear()
+
+    def close_channel(self, number: int) -> None:
+        """Close channel `number` of every connection like a channel error"""
+        for writer in self._writers:
+            close = commands.Channel.Close(406, "PRECONDITION_FAILED", 0, 0)
+            writer.write(frame.marshal(close, number))
+            self._channel_ready.pop((writer, number), None)
+
+    async def close(self) -> None:
+        self.kill()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if self.refuse:
+            writer.transport.abort()  # type: ignore
+            return
+
+        self._writers.add(writer)
+        buffer = b""
+        # channel -> method frame, header, body parts of the publish being read
+        publishing: dict[int, list] = {}
+        confirms: dict[int, int] = {}
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                while len(buffer) > 0:
+                    try:
+                        size, channel, value = frame.unmarshal(buffer)
+                    except UnmarshalingException:
+                        break
+                    buffer = buffer[size:]
+                    self._on_frame(writer, channel, value, publishing, confirms)
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            for queue, consumer in list(self._consumers.items()):
+                if consumer[0] is writer:
+                    del self._consumers[queue]
+            writer.close()
+
+    def _on_frame(
+        self,
+        writer: asyncio.StreamWriter,
+        channel: int,
+        value: object,
+        publishing: dict[int, list],
+        confirms: dict[int, int],
+    ) -> None:
+        def send(*values: object) -> None:
+            writer.write(b"".join(frame.marshal(v, channel) for v in values))  # type: ignore
+
+        if isinstance(value, ProtocolHeader):
+            send(
+                commands.Connection.Start(
+                    server_properties={
+                        "product": "fake",
+                        "capabilities": {
+                            "publisher_confirms": True,
+                            "basic.nack": True,
+                            "consumer_cancel_notify": True,
+                            "per_consumer_qos": True,
+                        },
+                    }
+                )
+            )
+        elif isinstance(value, commands.Connection.StartOk):
+            send(commands.Connection.Tune(channel_max=2047, frame_max=131072))
+        elif isinstance(value, commands.Connection.Open):
+            send(commands.Connection.OpenOk())
+        elif isinstance(value, commands.Connection.Close):
+            send(commands.Connection.CloseOk())
+            writer.close()
+        elif isinstance(value, commands.Channel.Open):
+            send(commands.Channel.OpenOk())
+        elif isinstance(value, commands.Channel.Close):
+            send(commands.Channel.CloseOk())
+        elif isinstance(value, commands.Confirm.Select):
+            confirms[channel] = 0
+            if not value.nowait:
+                send(commands.Confirm.SelectOk())
+        elif isinstance(value, commands.Basic.Qos):
+            send(commands.Basic.QosOk())
+        elif isinstance(value, commands.Exchange.Declare):
+            send(commands.Exchange.DeclareOk())
+        elif isinstance(value, commands.Queue.Declare):
+            name = value.queue or f"amq.gen-{next(self._queue_names)}"
+            send(commands.Queue.DeclareOk(name, 0, 0))
+        elif isinstance(value, commands.Queue.Bind):
+            send(commands.Queue.BindOk())
+        elif isinstance(value, commands.Basic.Consume):
+            tag = value.consumer_tag or f"ctag-{next(self._queue_names)}"
+            self._consumers[value.queue] = (writer, channel, tag)
+            send(commands.Basic.ConsumeOk(tag))
+        elif isinstance(value, commands.Basic.Cancel):
+            send(commands.Basic.CancelOk(value.consumer_tag))
+        elif isinstance(value, commands.Basic.Publish):
+            publishing[channel] = [value, None, b""]
+        elif isinstance(value, ContentHeader):
+            publishing[channel][1] = value
+        elif isinstance(value, ContentBody):
+            publish = publishing[channel]
+            publish[2] += value.value
+            if len(publish[2]) < publish[1].body_size:
+                return
+            del publishing[channel]
+            confirm = None
+            if channel in confirms:
+                confirms[channel] += 1
+                confirm = confirms[channel]
+
+            if self.channel_latency <= 0:
+                self._route(writer, channel, confirm, publish[1].properties, publish[2])
+                return
+
+            loop = asyncio.get_running_loop()
+            key = (writer, channel)
+            ready = max(loop.time(), self._channel_ready.get(key, 0.0))
+            ready += self.channel_latency
+            self._channel_ready[key] = ready
+            loop.call_at(
+                ready,
+                self._route,
+                writer,
+                channel,
+                confirm,
+                publish[1].properties,
+                publish[2],
+            )
+
+    def _route(
+        self,
+        writer: asyncio.StreamWriter,
+        channel: int,
+        confirm: Optional[int],
+        properties: commands.Basic.Properties,
+        body: bytes,
+    ) -> None:
+        if writer.is_closing():
+            return
+
+        self.published += 1
+        if confirm is not None:
+            writer.write(frame.marshal(commands.Basic.Ack(confirm), channel))
+        self._answer(properties, body)
+
+    def _answer(self, properties: commands.Basic.Properties, body: bytes) -> None:
+        data = orjson.loads(body)
+        request = Request(data["uuid"], data["command"], data["payload"])
+        response = self.responder.handle(request)
+        loop = asyncio.get_running_loop()
+        loop.call_later(
+            self.responder.delay(),
+            self._deliver,
+            properties.reply_to,
+            properties.correlation_id,
+            orjson.dumps(response.to_dict()),
+        )
+
+    def _deliver(self, queue: str, correlation_id: str, body: bytes) -> None:
+        consumer = self._consumers.get(queue)
+        if consumer is None:
+            return
+
+        writer, channel, tag = consumer
+        delivery_tag = self._delivery_tags.get((writer, channel), 0) + 1
+        self._delivery_tags[(writer, channel)] = delivery_tag
+        properties = commands.Basic.Properties(correlation_id=correlation_id)
+        writer.write(
+            frame.marshal(
+                commands.Basic.Deliver(tag, delivery_tag, False, "", queue), channel
+            )
+            + frame.marshal(ContentHeader(0, len(body), properties), channel)
+            + frame.marshal(ContentBody(body), channel)
+        )
+
+
+async def mq_request(mq: MQ, name: str, timeout: float) -> Response:
+    """General result `name` over `mq`, its `recv` and publisher have to run"""
+    uuid, future = mq.pending.create(timeout)
+    try:
+        await mq.general_result(uuid, name)
+        return await future
+    finally:
+        mq.pending.discard(uuid)
+
+
+async def wait_connected(mq: MQ, connected: bool = True) -> None:
+    while mq.connected != connected:
+        await asyncio.sleep(0.01)
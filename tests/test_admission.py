@@ -0,0 +1,14 @@
+from randomall_tg_bot.admission import AdmissionControl
+from randomall_tg_bot.router import BUSY_MESSAGE
+from tests.fake import FakeBot, FakeResponder, custom_info
+
+
+def test_requests_over_limit_get_busy_message():
+    bot = FakeBot(FakeResponder(0.2, {id: custom_info(id) for id in range(1, 6)}))
+    bot.router.admission = AdmissionControl(2, 0)
+
+    bot.run([bot.update(id, f"/custom {id}") for id in range(1, 6)])
+
+    texts = [text for _, text in bot.messages()]
+    assert len(bot.responder.requests) == 2
+    assert texts.count(BUSY_MESSAGE) == 3
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import socket
+
+import httpx
+import pytest
+
+from randomall_tg_bot import app as app_module
+from randomall_tg_bot.app import stop_task, webhook_options
+from tests.fake import FakeBot, FakeResponder
+
+SECRET = "secret"
+
+
+def test_stop_task_cancels_running_task():
+    async def main() -> asyncio.Task:
+        task = asyncio.create_task(asyncio.sleep(60))
+        await asyncio.sleep(0)
+        await stop_task(task, "Sleeper")
+        return task
+
+    assert asyncio.run(main()).cancelled()
+
+
+def test_stop_task_logs_failed_task(caplog):
+    async def fail() -> None:
+        raise RuntimeError("broken")
+
+    async def main() -> None:
+        task = asyncio.create_task(fail())
+        await asyncio.sleep(0)
+        # Shutdown goes on after a task that died before
+        await stop_task(task, "Failing")
+
+    with caplog.at_level(logging.ERROR):
+        asyncio.run(main())
+    assert "Failing failed" in caplog.text
+
+
+@pytest.fixture
+def webhook(monkeypatch) -> int:
+    """Webhook settings with a free local port"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    monkeypatch.setattr(app_module, "TELEGRAM_WEBHOOK_URL", "https://bot.test/hook")
+    monkeypatch.setattr(app_module, "TELEGRAM_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(app_module, "WEBHOOK_LISTEN", "127.0.0.1")
+    monkeypatch.setattr(app_module, "WEBHOOK_PORT", port)
+    monkeypatch.setattr(app_module, "WEBHOOK_PATH", "hook")
+    return port
+
+
+def test_webhook_requires_secret(webhook, monkeypatch):
+    monkeypatch.setattr(app_module, "TELEGRAM_WEBHOOK_SECRET", "")
+
+    with pytest.raises(ValueError):
+        webhook_options()
+
+
+def test_polling_without_webhook_url(monkeypatch):
+    monkeypatch.setattr(app_module, "TELEGRAM_WEBHOOK_URL", "")
+
+    assert webhook_options() is None
+
+
+def test_webhook_rejects_wrong_secret(webhook):
+    bot = FakeBot(FakeResponder(), updater=True)
+
+    async def post(client: httpx.AsyncClient, secret: str, chat_id: int) -> int:
+        response = await client.post(
+            f"http://127.0.0.1:{webhook}/hook",
+            json=bot.update(chat_id, "/help").to_dict(),
+            headers={"X-Telegram-Bot-Api-Secret-Token": secret},
+        )
+        return response.status_code
+
+    async def main() -> tuple[int, int]:
+        app = bot.app
+        assert app.updater is not None
+        await app.initialize()
+        await app.updater.start_webhook(**webhook_options())  # type: ignore[arg-type]
+        await app.start()
+        try:
+            async with httpx.AsyncClient() as client:
+                statuses = await post(client, "wrong", 1), await post(client, SECRET, 2)
+            await app.update_queue.join()
+        finally:
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+        return statuses
+
+    assert asyncio.run(main()) == (403, 200)
+    assert [chat_id for chat_id, _ in bot.messages()] == [2]
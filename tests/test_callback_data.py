@@ -0,0 +1,129 @@
+import pytest
+
+from randomall_tg_bot.callback_data import (
+    ACTION_FIRST,
+    ACTION_REPEAT,
+    CallbackData,
+    InvalidIdError,
+)
+from randomall_tg_bot.messages import (
+    COMMAND_CUSTOM_INFO,
+    COMMAND_CUSTOM_RESULT_MULTI,
+    COMMAND_CUSTOM_RESULT_SINGLE,
+    COMMAND_GENERAL_RESULT,
+)
+from randomall_tg_bot.router import ID_MUST_BE_A_NUMBER_MESSAGE
+from tests.fake import FakeBot, FakeResponder, custom_info
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        CallbackData(COMMAND_GENERAL_RESULT, ACTION_FIRST, target="names_male"),
+        CallbackData(COMMAND_GENERAL_RESULT, ACTION_REPEAT, target="plot"),
+        CallbackData(COMMAND_CUSTOM_INFO, id=123654),
+        CallbackData(COMMAND_CUSTOM_RESULT_SINGLE, ACTION_FIRST, id=1),
+        CallbackData(COMMAND_CUSTOM_RESULT_SINGLE, ACTION_REPEAT, id=0),
+        CallbackData(COMMAND_CUSTOM_RESULT_MULTI, ACTION_FIRST, id=35, button_id=36),
+        CallbackData(COMMAND_CUSTOM_RESULT_MULTI, ACTION_REPEAT, id=7, button_id=0),
+    ],
+)
+def test_round_trip(data):
+    assert CallbackData.decode(data.encode()) == data
+
+
+def test_encoded_example():
+    data = CallbackData(COMMAND_CUSTOM_RESULT_SINGLE, ACTION_REPEAT, id=123654)
+    assert data.encode() == "1e2neu"
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (
+            "general_result:repeat:names_male",
+            CallbackData(COMMAND_GENERAL_RESULT, ACTION_REPEAT, target="names_male"),
+        ),
+        ("custom_info:42", CallbackData(COMMAND_CUSTOM_INFO, id=42)),
+        (
+            "custom_result_single:single:first:42",
+            CallbackData(COMMAND_CUSTOM_RESULT_SINGLE, ACTION_FIRST, id=42),
+        ),
+        (
+            "custom_result_multi:multi:repeat:42:3",
+            CallbackData(
+                COMMAND_CUSTOM_RESULT_MULTI, ACTION_REPEAT, id=42, button_id=3
+            ),
+        ),
+    ],
+)
+def test_decode_legacy(data, expected):
+    assert CallbackData.decode(data) == expected
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "1c!",
+        "1fa.?",
+        "custom_info:abc",
+        "custom_result_single:single:first:x",
+        "custom_result_multi:multi:repeat:42:x",
+    ],
+)
+def test_decode_invalid_id(data):
+    with pytest.raises(InvalidIdError):
+        CallbackData.decode(data)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "",
+        "1",
+        "1z1",
+        "1c1.2",
+        "1f1",
+        "1b",
+        "general_result:first:",
+        "custom_result_single:42",
+        "unknown:1",
+    ],
+)
+def test_decode_malformed(data):
+    with pytest.raises(ValueError) as exc_info:
+        CallbackData.decode(data)
+    assert not isinstance(exc_info.value, InvalidIdError)
+
+
+def press(data: str) -> FakeBot:
+    bot = FakeBot(FakeResponder())
+    bot.run([bot.update(1, data=data)])
+    return bot
+
+
+def test_press_with_invalid_id_is_replied():
+    bot = press("1c!")
+
+    assert bot.telegram_request.calls["answerCallbackQuery"] == 1
+    assert bot.messages() == [(1, ID_MUST_BE_A_NUMBER_MESSAGE)]
+
+
+@pytest.mark.parametrize("data", ["1z1", "1b", "something:else"])
+def test_press_with_malformed_data_is_only_answered(data):
+    bot = press(data)
+
+    assert bot.telegram_request.calls["answerCallbackQuery"] == 1
+    assert bot.messages() == []
+
+
+def test_repeated_presses_of_message_are_only_answered():
+    bot = FakeBot(FakeResponder(0.05, {1: custom_info(1)}))
+    data = CallbackData(COMMAND_CUSTOM_INFO, id=1).encode()
+
+    bot.run([bot.update(1, data=data, message_id=10) for _ in range(5)])
+
+    assert len(bot.responder.requests) == 1
+    assert len(bot.messages()) == 1
+    assert bot.telegram_request.calls["answerCallbackQuery"] == 5
+    assert bot.router.callback_deduped == 4
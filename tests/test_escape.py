@@ -0,0 +1,38 @@
+import random
+
+from randomall_tg_bot.callback_data import CallbackData
+from randomall_tg_bot.messages import COMMAND_CUSTOM_INFO
+from randomall_tg_bot.router import escape_text
+from tests.fake import FakeBot, FakeResponder, custom_info
+
+SPECIAL = "_*[]()~`>#+-=|{}.!"
+ALPHABET = SPECIAL + "\\ \nabcxyzабвгдеёжзя0123456789😀"
+
+
+def escape_text_replace(text: str) -> str:
+    """Previous implementation, one replace per character"""
+    for ch in SPECIAL:
+        text = text.replace(ch, f"\\{ch}")
+    return text
+
+
+def test_escape_text_is_the_same_as_replace():
+    rng = random.Random(0)
+    for _ in range(10000):
+        text = "".join(rng.choices(ALPHABET, k=rng.randrange(0, 100)))
+        assert escape_text(text) == escape_text_replace(text)
+
+
+def test_escape_text_leaves_plain_text():
+    assert escape_text("") == ""
+    assert escape_text("Генератор 1") == "Генератор 1"
+
+
+def test_custom_info_title_is_escaped():
+    info = custom_info(1)
+    info["title"] = "Gen_1 (beta)!"
+    bot = FakeBot(FakeResponder(0, {1: info}))
+
+    bot.run([bot.update(1, data=CallbackData(COMMAND_CUSTOM_INFO, id=1).encode())])
+
+    assert bot.messages() == [(1, "*Gen\\_1 \\(beta\\)\\!*\nDescription\\.")]
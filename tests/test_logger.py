@@ -0,0 +1,90 @@
+import threading
+import time
+
+import orjson
+import pytest
+
+from randomall_tg_bot.logger import (
+    LOG_QUEUE_BLOCK_TIMEOUT,
+    LOG_QUEUE_POLICY_BLOCK,
+    LOG_QUEUE_POLICY_DROP,
+    Event,
+    EventWriter,
+)
+
+
+def user_ids(path) -> list[int]:
+    """Users of the events written to `path`, in order"""
+    with open(path, "rb") as f:
+        return [orjson.loads(line.split(b" ", 1)[1])["user_id"] for line in f]
+
+
+def test_close_writes_queued_events(tmp_path):
+    path = tmp_path / "actions.log"
+    writer = EventWriter(str(path), 100, LOG_QUEUE_POLICY_DROP, 60, 100, 0, 0)
+    for user_id in range(3):
+        writer.put(Event("help", user_id))
+    # Batch is neither full nor due yet
+    assert not path.exists()
+
+    writer.close()
+
+    assert user_ids(path) == [0, 1, 2]
+    assert writer.written == 3
+
+
+def test_rotation_keeps_backup_count_files(tmp_path):
+    path = tmp_path / "actions.log"
+    # Every event is a batch of its own and fills the file
+    writer = EventWriter(str(path), 100, LOG_QUEUE_POLICY_BLOCK, 60, 1, 1, 2)
+    for user_id in range(4):
+        writer.put(Event("help", user_id))
+    writer.close()
+
+    assert user_ids(f"{path}.1") == [3]
+    assert user_ids(f"{path}.2") == [2]
+    assert not (tmp_path / "actions.log.3").exists()
+
+
+def test_rotation_without_backups_truncates(tmp_path):
+    path = tmp_path / "actions.log"
+    writer = EventWriter(str(path), 100, LOG_QUEUE_POLICY_BLOCK, 60, 1, 1, 0)
+    writer.put(Event("help", 1))
+    writer.close()
+
+    assert path.read_bytes() == b""
+    assert list(tmp_path.iterdir()) == [path]
+
+
+@pytest.mark.parametrize("policy", [LOG_QUEUE_POLICY_DROP, LOG_QUEUE_POLICY_BLOCK])
+def test_events_over_full_queue_are_dropped(tmp_path, monkeypatch, policy):
+    path = tmp_path / "actions.log"
+    writer = EventWriter(str(path), 1, policy, 60, 1, 0, 0)
+    release = threading.Event()
+    write = writer._write
+
+    def stuck_write(data: bytes) -> None:
+        release.wait()
+        write(data)
+
+    monkeypatch.setattr(writer, "_write", stuck_write)
+    writer.put(Event("help", 0))
+    # Thread took the first event and is stuck writing it
+    while not writer._queue.empty():
+        time.sleep(0.001)
+    writer.put(Event("help", 1))
+
+    start = time.monotonic()
+    writer.put(Event("help", 2))
+    writer.put(Event("help", 3))
+    elapsed = time.monotonic() - start
+    release.set()
+    writer.close()
+
+    assert writer.dropped == 2
+    assert writer.written == 2
+    assert user_ids(path) == [0, 1]
+    if policy == LOG_QUEUE_POLICY_BLOCK:
+        assert elapsed >= 2 * LOG_QUEUE_BLOCK_TIMEOUT
+    else:
+        assert elapsed < LOG_QUEUE_BLOCK_TIMEOUT
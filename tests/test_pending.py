@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from randomall_tg_bot.messages import (
+    COMMAND_CUSTOM_INFO,
+    RESPONSE_STATUS_OK,
+    Response,
+)
+from randomall_tg_bot.pending import PendingRequests
+
+
+def response(uuid: str) -> Response:
+    return Response(uuid, COMMAND_CUSTOM_INFO, RESPONSE_STATUS_OK, {})
+
+
+def test_requests_expire_in_deadline_order():
+    async def main() -> None:
+        pending = PendingRequests(resolution=0.01)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        expired_at: dict[float, float] = {}
+
+        async def wait(timeout: float) -> None:
+            _, future = pending.create(timeout)
+            with pytest.raises(asyncio.exceptions.TimeoutError):
+                await future
+            expired_at[timeout] = loop.time() - start
+
+        # Created out of order, the shorter deadline reschedules the timer
+        await asyncio.gather(wait(0.3), wait(0.1), wait(0.2))
+
+        assert pending.expired == 3
+        assert len(pending) == 0
+        for timeout, elapsed in expired_at.items():
+            assert timeout <= elapsed < timeout + 0.1
+
+    asyncio.run(main())
+
+
+def test_resolved_request_does_not_expire():
+    async def main() -> None:
+        pending = PendingRequests(resolution=0.01)
+        uuid, future = pending.create(0.05)
+        other_uuid, other_future = pending.create(0.1)
+
+        assert pending.resolve(uuid, response(uuid))
+        assert not pending.resolve(uuid, response(uuid))
+        assert (await future).uuid == uuid
+
+        with pytest.raises(asyncio.exceptions.TimeoutError):
+            await other_future
+        assert pending.expired == 1
+        assert not pending.resolve(other_uuid, response(other_uuid))
+
+    asyncio.run(main())
+
+
+def test_deadlines_within_resolution_expire_together():
+    async def main() -> None:
+        pending = PendingRequests(resolution=0.05)
+        futures = [pending.create(0.1 + i * 0.01)[1] for i in range(3)]
+
+        done, _ = await asyncio.wait(futures, timeout=0.1 + 0.05 + 0.02)
+        assert len(done) == 3
+        assert pending.expired == 3
+
+    asyncio.run(main())
+
+
+def test_discarded_request_is_forgotten():
+    async def main() -> None:
+        pending = PendingRequests(resolution=0.01)
+        uuid, future = pending.create(0.05)
+        pending.discard(uuid)
+
+        assert uuid not in pending
+        assert not pending.resolve(uuid, response(uuid))
+        await asyncio.sleep(0.1)
+        assert not future.done()
+        assert pending.expired == 0
+
+    asyncio.run(main())
+
+
+def test_join_waits_for_requests_in_flight():
+    async def main() -> None:
+        pending = PendingRequests(resolution=0.01)
+        uuid, _ = pending.create(1.0)
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.05, pending.resolve, uuid, response(uuid))
+
+        assert not await pending.join(0.02)
+        assert await pending.join(0.5)
+
+    asyncio.run(main())
+
+
+def test_fail_all():
+    async def main() -> None:
+        pending = PendingRequests()
+        futures = [pending.create(1.0)[1] for _ in range(3)]
+        pending.fail_all(ConnectionError())
+
+        assert len(pending) == 0
+        for future in futures:
+            with pytest.raises(ConnectionError):
+                await future
+
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+from randomall_tg_bot.messages import (
+    COMMAND_GENERAL_RESULT_BATCH,
+    RESPONSE_STATUS_INTERNAL_ERROR,
+    RESPONSE_STATUS_NOT_IMPLEMENTED,
+    RESPONSE_STATUS_OK,
+    Request,
+    Response,
+)
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.prefetch import GeneralPrefetcher
+from tests.fake import FakeMQ, FakeResponder
+
+SIZE = 5
+
+
+class FailingBatchResponder(FakeResponder):
+    """Answers batch requests with `status` and `payload`"""
+
+    def __init__(self, status: str, payload: Optional[dict] = None) -> None:
+        super().__init__()
+        self.status = status
+        self.payload = payload
+
+    def handle(self, request: Request) -> Response:
+        if request.command == COMMAND_GENERAL_RESULT_BATCH:
+            self.requests.append(request)
+            return Response(request.uuid, request.command, self.status, self.payload)
+        return super().handle(request)
+
+
+def refill(responder: FakeResponder) -> GeneralPrefetcher:
+    async def main() -> GeneralPrefetcher:
+        pending = PendingRequests()
+        prefetcher = GeneralPrefetcher(
+            FakeMQ(responder, pending), pending, ["plot"], SIZE, 2, 60, 1.0
+        )
+        await prefetcher._refill("plot")
+        return prefetcher
+
+    return asyncio.run(main())
+
+
+def test_batch_refill():
+    responder = FakeResponder()
+    prefetcher = refill(responder)
+
+    assert len(prefetcher.buffers["plot"]) == SIZE
+    assert len(responder.requests) == 1
+
+
+@pytest.mark.parametrize(
+    "status, batch",
+    [
+        # Batches are not tried again
+        (RESPONSE_STATUS_NOT_IMPLEMENTED, False),
+        # Only this refill falls back
+        (RESPONSE_STATUS_INTERNAL_ERROR, True),
+    ],
+)
+def test_failed_batch_falls_back_to_single_requests(status, batch):
+    responder = FailingBatchResponder(status)
+    prefetcher = refill(responder)
+
+    assert len(prefetcher.buffers["plot"]) == SIZE
+    assert len(responder.requests) == 1 + SIZE
+    assert prefetcher.batch is batch
+
+
+@pytest.mark.parametrize("payload", [None, {"msg": "single result"}, {"msgs": 1}])
+def test_batch_without_results_falls_back_to_single_requests(payload):
+    responder = FailingBatchResponder(RESPONSE_STATUS_OK, payload)
+    prefetcher = refill(responder)
+
+    assert len(prefetcher.buffers["plot"]) == SIZE
+    assert len(responder.requests) == 1 + SIZE
+    assert prefetcher.batch is True
+
+
+def test_run_goes_on_after_failed_refill():
+    async def main() -> int:
+        pending = PendingRequests()
+        prefetcher = GeneralPrefetcher(
+            FakeMQ(FakeResponder(), pending), pending, ["plot"], SIZE, 2, 0.01, 1.0
+        )
+        calls = 0
+
+        async def refill_batch(target: str, count: int) -> None:
+            nonlocal calls
+            calls += 1
+            raise RuntimeError("broken reply")
+
+        prefetcher._refill_batch = refill_batch  # type: ignore
+        task = asyncio.create_task(prefetcher.run())
+        await asyncio.sleep(0.1)
+        assert not task.done()
+        task.cancel()
+        return calls
+
+    assert asyncio.run(main()) > 1
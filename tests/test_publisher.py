@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+from aio_pika import Message
+
+from randomall_tg_bot.messages import COMMAND_GENERAL_RESULT
+from randomall_tg_bot.mq import MQ
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import (
+    CHANNEL_SELECTION_ROUND_ROBIN,
+    PUBLISH_POLICY_BLOCK,
+    PUBLISH_POLICY_FAIL,
+    PUBLISH_POLICY_SHED,
+    ChannelPool,
+    Publisher,
+    PublishRejectedError,
+)
+from randomall_tg_bot.supervisor import MQSupervisor
+from tests.fake import FakeBroker, FakeResponder, mq_request, wait_connected
+
+QUEUE_SIZE = 2
+
+
+def stopped_publisher(policy: str) -> Publisher:
+    """Publisher whose task is not running, so the buffer only fills up"""
+    pending = PendingRequests()
+    pool = ChannelPool(1, CHANNEL_SELECTION_ROUND_ROBIN, "", True)
+    return Publisher(pool, "requests", pending, QUEUE_SIZE, policy, 100)
+
+
+async def submit(publisher: Publisher) -> asyncio.Future:
+    uuid, future = publisher.pending.create(10.0)
+    await publisher.submit(uuid, COMMAND_GENERAL_RESULT, Message(b""))
+    return future
+
+
+def test_shed_fails_oldest_request():
+    async def main() -> None:
+        publisher = stopped_publisher(PUBLISH_POLICY_SHED)
+        futures = [await submit(publisher) for _ in range(QUEUE_SIZE + 1)]
+
+        with pytest.raises(PublishRejectedError):
+            await futures[0]
+        assert not any(future.done() for future in futures[1:])
+        assert publisher.shed == 1
+        assert len(publisher) == QUEUE_SIZE
+
+    asyncio.run(main())
+
+
+def test_fail_rejects_newest_request():
+    async def main() -> None:
+        publisher = stopped_publisher(PUBLISH_POLICY_FAIL)
+        futures = [await submit(publisher) for _ in range(QUEUE_SIZE)]
+
+        with pytest.raises(PublishRejectedError):
+            await submit(publisher)
+        assert not any(future.done() for future in futures)
+        assert publisher.rejected == 1
+        assert len(publisher) == QUEUE_SIZE
+
+    asyncio.run(main())
+
+
+def test_block_waits_for_room():
+    async def main() -> None:
+        publisher = stopped_publisher(PUBLISH_POLICY_BLOCK)
+        for _ in range(QUEUE_SIZE):
+            await submit(publisher)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(submit(publisher), 0.05)
+        assert publisher.shed == publisher.rejected == 0
+
+    asyncio.run(main())
+
+
+async def wait_until(condition, timeout: float = 1.0) -> None:
+    async def poll() -> None:
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def test_closed_channel_is_replaced():
+    async def main() -> None:
+        broker = FakeBroker(FakeResponder())
+        await broker.start()
+        mq = MQ(
+            broker.url,
+            PendingRequests(),
+            publish_channels=3,
+            publish_channel_selection=CHANNEL_SELECTION_ROUND_ROBIN,
+        )
+        supervisor_task = asyncio.create_task(MQSupervisor(mq, 0.05, 0.2).run())
+        try:
+            await asyncio.wait_for(wait_connected(mq), 1.0)
+            pool = mq.publisher.pool
+            closed = pool.channels[1].channel
+            broker.close_channel(closed.number)
+            await wait_until(lambda: closed.is_closed)
+
+            responses = await asyncio.gather(
+                *(mq_request(mq, "plot", 1.0) for _ in range(6))
+            )
+
+            assert all(response.payload is not None for response in responses)
+            assert broker.published == 6
+            await wait_until(lambda: pool.replaced == 1)
+            assert pool.open_channels == 3
+            assert pool.channels[1].channel is not closed
+            assert mq.connected
+        finally:
+            supervisor_task.cancel()
+            await asyncio.gather(supervisor_task, return_exceptions=True)
+            await mq.close()
+            await broker.close()
+
+    asyncio.run(main())
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from randomall_tg_bot.ratelimit import Result, SendScheduler, TokenBucket
+
+
+def test_token_bucket_allows_burst_then_rate():
+    async def main() -> tuple[float, float]:
+        bucket = TokenBucket(20, 5)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        burst = time.monotonic() - start
+        for _ in range(4):
+            await bucket.acquire()
+        return burst, time.monotonic() - start
+
+    burst, total = asyncio.run(main())
+    assert burst < 0.05
+    assert 0.15 <= total < 0.4
+
+
+def flood_limited(retry_afters: list[float]):
+    """Bot API call raising `RetryAfter` for each of `retry_afters` first"""
+    calls = []
+
+    async def callback(name: str) -> bool:
+        calls.append((name, time.monotonic()))
+        if retry_afters:
+            raise RetryAfter(retry_afters.pop(0))  # type: ignore[arg-type]
+        return True
+
+    return callback, calls
+
+
+async def send(scheduler: SendScheduler, callback, name: str) -> Result:
+    return await scheduler.process_request(
+        callback, (name,), {}, "sendMessage", {"chat_id": 1}, None
+    )
+
+
+def test_request_is_retried_after_flood_limit():
+    async def main() -> None:
+        scheduler = SendScheduler(1000, 1000, 1000, 1)
+        callback, calls = flood_limited([0.1])
+
+        assert await send(scheduler, callback, "a") is True
+        assert len(calls) == 2
+        assert calls[1][1] - calls[0][1] >= 0.1
+        assert scheduler.retries == 1
+        assert scheduler.sent == 1
+
+    asyncio.run(main())
+
+
+def test_flood_limit_is_raised_after_max_retries():
+    async def main() -> None:
+        scheduler = SendScheduler(1000, 1000, 1000, 1)
+        callback, calls = flood_limited([0.01, 0.01])
+
+        with pytest.raises(RetryAfter):
+            await send(scheduler, callback, "a")
+        assert len(calls) == 2
+        assert scheduler.sent == 0
+
+    asyncio.run(main())
+
+
+def test_shorter_flood_limit_does_not_end_longer_one():
+    async def main() -> None:
+        scheduler = SendScheduler(1000, 1000, 1000, 1)
+        callback, calls = flood_limited([0.3, 0.1])
+        start = time.monotonic()
+
+        await asyncio.gather(
+            send(scheduler, callback, "a"), send(scheduler, callback, "b")
+        )
+        await send(scheduler, callback, "c")
+
+        retried = [at - start for name, at in calls[2:]]
+        assert len(retried) == 3
+        assert min(retried) >= 0.3
+
+    asyncio.run(main())
@@ -0,0 +1,191 @@
+import asyncio
+from typing import Optional, Union
+
+import pytest
+
+from randomall_tg_bot.messages import (
+    COMMAND_GENERAL_RESULT,
+    RESPONSE_STATUS_OK,
+    Response,
+)
+from randomall_tg_bot.mq import MQDisconnectedError
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.publisher import PublishRejectedError
+from randomall_tg_bot.requester import MAX_HEDGE_BURST, Requester
+
+COMMAND = COMMAND_GENERAL_RESULT
+KEY = (COMMAND, "plot")
+
+Step = Union[None, float, BaseException, tuple[float, BaseException]]
+
+
+def response(uuid: str) -> Response:
+    return Response(uuid, COMMAND, RESPONSE_STATUS_OK, {"msg": uuid})
+
+
+class ScriptedSend:
+    """
+    `send` of a request, the n-th publish goes as `script[n]` says: seconds
+    until the reply, (seconds, exception) to fail it, an exception to raise
+    from the publish itself, None for no reply
+    """
+
+    def __init__(self, pending: PendingRequests, script: list[Step]) -> None:
+        self.pending = pending
+        self.script = script
+        self.uuids: list[str] = []
+
+    async def __call__(self, uuid: str) -> None:
+        step = self.script[len(self.uuids)]
+        self.uuids.append(uuid)
+        loop = asyncio.get_running_loop()
+        if isinstance(step, BaseException):
+            raise step
+        if isinstance(step, tuple):
+            delay, exc = step
+            loop.call_later(delay, self.pending.fail, uuid, exc)
+        elif step is not None:
+            loop.call_later(step, self.pending.resolve, uuid, response(uuid))
+
+
+def hedging_requester(pending: PendingRequests, **kwargs) -> Requester:
+    """Hedges after 0.02s, the median stays there for a few requests"""
+    kwargs.setdefault("hedge_budget", 1.0)
+    requester = Requester(pending, 1.0, hedge_quantile=0.5, min_samples=1, **kwargs)
+    for _ in range(10):
+        requester._observe(COMMAND, KEY, 0.02)
+    return requester
+
+
+async def request(
+    requester: Requester, script: list[Step]
+) -> tuple[Optional[Response], ScriptedSend]:
+    send = ScriptedSend(requester.pending, script)
+    result = await requester.request(COMMAND, KEY[1], send)
+    return result, send
+
+
+def test_hedges_are_paid_from_budget():
+    async def main() -> Requester:
+        requester = hedging_requester(PendingRequests(), hedge_budget=0.5)
+        for _ in range(4):
+            await request(requester, [0.1, 0.1])
+        return requester
+
+    requester = asyncio.run(main())
+    assert requester.requests == 4
+    assert requester.hedged == 2
+
+
+def test_budget_is_capped():
+    async def main() -> Requester:
+        requester = Requester(PendingRequests(), 1.0, hedge_budget=100.0)
+        await request(requester, [0.01])
+        return requester
+
+    assert asyncio.run(main())._budget == MAX_HEDGE_BURST
+
+
+def test_hedge_answered_first_wins_and_loser_is_discarded():
+    async def main() -> None:
+        pending = PendingRequests()
+        requester = hedging_requester(pending)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        result, send = await request(requester, [0.5, 0.01])
+
+        assert loop.time() - start < 0.2
+        assert result is not None and result.uuid == send.uuids[1]
+        assert requester.hedged == 1
+        assert requester.hedge_wins == 1
+        # Late reply of the first copy has nobody to go to
+        assert len(pending) == 0
+        assert not pending.resolve(send.uuids[0], response(send.uuids[0]))
+
+    asyncio.run(main())
+
+
+def test_first_copy_can_still_win():
+    async def main() -> None:
+        requester = hedging_requester(PendingRequests())
+
+        result, send = await request(requester, [0.05, 0.5])
+
+        assert result is not None and result.uuid == send.uuids[0]
+        assert requester.hedged == 1
+        assert requester.hedge_wins == 0
+
+    asyncio.run(main())
+
+
+def test_failed_copy_does_not_win():
+    async def main() -> None:
+        requester = hedging_requester(PendingRequests())
+
+        result, send = await request(requester, [(0.03, RuntimeError()), 0.05])
+
+        assert result is not None and result.uuid == send.uuids[1]
+        assert requester.hedge_wins == 1
+
+    asyncio.run(main())
+
+
+def test_both_copies_failing_raise():
+    async def main() -> None:
+        pending = PendingRequests()
+        requester = hedging_requester(pending)
+
+        with pytest.raises(RuntimeError):
+            await request(requester, [(0.05, RuntimeError()), (0.01, RuntimeError())])
+        assert len(pending) == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "exc", [PublishRejectedError("full"), MQDisconnectedError("closed")]
+)
+def test_rejected_hedge_waits_for_first_copy(exc):
+    async def main() -> None:
+        pending = PendingRequests()
+        requester = hedging_requester(pending)
+
+        result, send = await request(requester, [0.05, exc])
+
+        assert result is not None and result.uuid == send.uuids[0]
+        assert requester.hedged == 1
+        assert requester.hedge_wins == 0
+        assert len(pending) == 0
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "multiplier, latency, timeout",
+    [
+        # Waits the longest without a multiplier
+        (0.0, 1.0, 5.0),
+        (2.0, 0.1, 1.0),
+        (2.0, 1.5, 3.0),
+        (2.0, 10.0, 5.0),
+    ],
+)
+def test_timeout_is_clamped(multiplier, latency, timeout):
+    requester = Requester(
+        PendingRequests(),
+        5.0,
+        min_timeout=1.0,
+        timeout_multiplier=multiplier,
+        min_samples=1,
+    )
+    requester._observe(COMMAND, KEY, latency)
+
+    assert requester.timeout(COMMAND, KEY) == timeout
+
+
+def test_timeout_without_samples_is_max():
+    requester = Requester(PendingRequests(), 5.0, timeout_multiplier=2.0)
+    requester._observe(COMMAND, KEY, 0.1)
+
+    assert requester.timeout(COMMAND, KEY) == 5.0
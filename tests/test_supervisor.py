@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+import pytest
+
+from randomall_tg_bot.messages import Response
+from randomall_tg_bot.mq import MQ, MQDisconnectedError
+from randomall_tg_bot.pending import PendingRequests
+from randomall_tg_bot.supervisor import MQSupervisor
+from tests.fake import FakeBroker, FakeResponder, mq_request, wait_connected
+
+TIMEOUT = 3.0
+
+
+async def request(mq: MQ, name: str) -> Response:
+    return await mq_request(mq, name, TIMEOUT)
+
+
+@pytest.mark.parametrize("rpc", [True, False])
+def test_reconnect_after_broker_crash(rpc):
+    async def main() -> None:
+        broker = FakeBroker(FakeResponder(latency=0.2))
+        await broker.start()
+        mq = MQ(broker.url, PendingRequests(), rpc)
+        supervisor = MQSupervisor(mq, 0.05, 0.2)
+        supervisor_task = asyncio.create_task(supervisor.run())
+        try:
+            await asyncio.wait_for(wait_connected(mq), 1.0)
+            assert (await request(mq, "names_male")).payload is not None
+
+            in_flight = asyncio.create_task(request(mq, "names_male"))
+            await asyncio.sleep(0.05)
+            broker.refuse = True
+            broker.kill()
+
+            start = time.perf_counter()
+            with pytest.raises(MQDisconnectedError):
+                await in_flight
+            assert time.perf_counter() - start < TIMEOUT / 2
+
+            await wait_connected(mq, False)
+            start = time.perf_counter()
+            with pytest.raises(MQDisconnectedError):
+                await request(mq, "names_male")
+            assert time.perf_counter() - start < 0.1
+
+            broker.refuse = False
+            await asyncio.wait_for(wait_connected(mq), 2.0)
+            assert supervisor.reconnects >= 1
+            assert (await request(mq, "names_female")).payload is not None
+        finally:
+            supervisor_task.cancel()
+            await asyncio.gather(supervisor_task, return_exceptions=True)
+            await mq.close()
+            await broker.close()
+
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import time
+
+from randomall_tg_bot.callback_data import CallbackData
+from randomall_tg_bot.messages import COMMAND_CUSTOM_INFO
+from tests.fake import FakeBot, FakeResponder, custom_info
+
+MQ_LATENCY = 0.2
+
+
+def fake_bot() -> FakeBot:
+    return FakeBot(FakeResponder(MQ_LATENCY, {1: custom_info(1), 2: custom_info(2)}))
+
+
+def test_chats_are_handled_concurrently():
+    bot = fake_bot()
+    data = CallbackData(COMMAND_CUSTOM_INFO, id=1).encode()
+
+    start = time.perf_counter()
+    bot.run([bot.update(chat_id, data=data) for chat_id in range(1, 6)])
+    elapsed = time.perf_counter() - start
+
+    assert len(bot.responder.requests) == 1
+    assert bot.router.custom_info_coalesced == 4
+    assert elapsed < MQ_LATENCY * 2
+
+
+def test_updates_of_chat_are_handled_in_order():
+    bot = fake_bot()
+    bot.run(
+        [bot.update(1, "/custom 1"), bot.update(1, "/help"), bot.update(2, "/help")]
+    )
+
+    messages = bot.messages()
+    # Help of chat 2 does not wait for chat 1
+    assert [chat_id for chat_id, _ in messages] == [2, 1, 1]
+    assert "Generator 1" in messages[1][1]